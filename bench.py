@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Faculty of Information Technology, Brno University of Technology
+IPP (Principles of Programming Languages) - Project 2
+Name: IPP benchmark of IPPcode18 language interpret
+Date created: April 2018
+Author: Jan Kubica
+Login: xkubic39
+Email: xkubic39@stud.fit.vutbr.cz
+File: bench.py - IPPcode18 interpret benchmark runner
+"""
+
+import sys
+import getopt
+import os
+import io
+import json
+import time
+import resource
+import subprocess
+import tempfile
+import importlib.util
+from xml.sax.saxutils import escape
+
+EXIT_CODES = {
+    'OK' :                       0,
+    'REGRESSION' :               1, # some benchmark regressed or failed
+    'INVALID_PARAMETER_ERROR' : 10,
+    'INPUT_FILE_ERROR' :        11,
+    'OUTPUT_FILE_ERROR' :       12
+}
+
+# ------ CORPUS -------
+"""
+Every benchmark is <name>.xml in benchmark directory (IPPcode18 source in <name>.src, parsed by
+parse.php), with optional input <name>.in. Programs which would be too big to keep in repository
+are generated to temporary directory before run (see GENERATED).
+"""
+STRAIGHT_LINE_BLOCKS = 5000 # 4 instructions each
+READ_LINES = 50000 # pairs of lines
+
+# huge straight-line program - many variables and literals, nearly all time is load and validation
+def straight_line_xml(path):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<program language="IPPcode18">']
+    order = 0
+    def instruction(opcode, *args):
+        nonlocal order
+        order += 1
+        lines.append('  <instruction order="' + str(order) + '" opcode="' + opcode + '">')
+        for i, (arg_type, text) in enumerate(args, 1):
+            lines.append('    <arg' + str(i) + ' type="' + arg_type + '">' + escape(text) + '</arg' + str(i) + '>')
+        lines.append('  </instruction>')
+    instruction("DEFVAR", ("var", "GF@s"))
+    for i in range(STRAIGHT_LINE_BLOCKS):
+        instruction("DEFVAR", ("var", "GF@v" + str(i)))
+        instruction("MOVE", ("var", "GF@v" + str(i)), ("int", str(i)))
+        instruction("ADD", ("var", "GF@v" + str(i)), ("var", "GF@v" + str(i)), ("int", str(i * 7)))
+        instruction("MOVE", ("var", "GF@s"), ("string", "item\\032" + str(i) + "&lt;done&gt;"))
+    instruction("WRITE", ("var", "GF@s"))
+    lines.append('</program>')
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+# input of read benchmark - text line followed by number
+def read_input(path):
+    with open(path, 'w') as f:
+        for i in range(READ_LINES):
+            f.write("line number " + str(i) + " of input\n" + str((i * 7919) % 2001 - 1000) + "\n")
+
+# generated files of corpus - name -> generator
+GENERATED = {
+    "straight_line.xml": straight_line_xml,
+    "read.in": read_input
+}
+
+# returns list of (name, xml file, input file or None) sorted by name
+def load_corpus(directory, work_dir):
+    for name, generator in GENERATED.items():
+        generator(os.path.join(work_dir, name))
+    corpus = []
+    for source_dir in (directory, work_dir):
+        for file_name in os.listdir(source_dir):
+            if file_name.endswith(".xml"):
+                name = file_name[:-4]
+                input_file = None
+                for input_dir in (directory, work_dir):
+                    if os.path.exists(os.path.join(input_dir, name + ".in")):
+                        input_file = os.path.join(input_dir, name + ".in")
+                corpus.append((name, os.path.join(source_dir, file_name), input_file))
+    return sorted(corpus)
+
+# ------ MEASUREMENT -------
+"""
+Each benchmark is measured in two processes (--child), so peak memory belongs only to interpret:
+    load        - reading, parsing and validation of XML elements (read_instructions of load_program)
+    validate    - compilation and checks of program (ProgramBuilder of load_program)
+    load_memory - peak resident memory of process which only loads program in MiB
+    exec        - run of compiled program by selected engine
+    ips         - executed instructions per second of exec (instructions counted by loop engine)
+    memory      - peak resident memory of process which loads and runs program in MiB
+Load is split by timing each call of ProgramBuilder.add, so validate includes two clock reads per
+instruction. Times are best of --repeat runs.
+"""
+# imports interpret script as module
+def import_interpret(path):
+    spec = importlib.util.spec_from_file_location("interpret", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# peak resident memory of this process in MiB - VmHWM of Linux, ru_maxrss elsewhere (ru_maxrss
+# of Linux keeps peak of parent process from before exec)
+def peak_memory():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024 # KiB
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux, bytes on macOS
+
+# loads program as load_program() does, returns (program, time of reading, time of compilation)
+def timed_load(interpret, xml_file):
+    clock = time.perf_counter
+    builder = interpret.ProgramBuilder()
+    compilation = 0.0
+    def add(instruction):
+        nonlocal compilation
+        start = clock()
+        builder.add(instruction)
+        compilation += clock() - start
+    start = clock()
+    with open(xml_file, 'rb') as f:
+        xml_len, error = interpret.read_instructions(f, xml_file, add)
+    middle = clock()
+    program = builder.finish(xml_len, error, xml_file)
+    end = clock()
+    return program, middle - start - compilation, end - middle + compilation
+
+# measures loading of one benchmark in this process, prints JSON result to stdout
+def measure_load(options):
+    interpret = import_interpret(options["int_script"])
+    result = {"error": None}
+    load = validate = None
+    for _ in range(options["repeat"]):
+        try:
+            program, read, compilation = timed_load(interpret, options["source"])
+        except interpret.LoadError as e:
+            result["error"] = e.message.strip()
+            print(json.dumps(result))
+            return
+        del program
+        load = read if load == None else min(load, read)
+        validate = compilation if validate == None else min(validate, compilation)
+    result["load"] = load
+    result["validate"] = validate
+    result["load_memory"] = peak_memory()
+    print(json.dumps(result))
+
+# measures execution of one benchmark in this process, prints JSON result to stdout
+def measure_exec(options):
+    interpret = import_interpret(options["int_script"])
+    clock = time.perf_counter
+    data = b""
+    if options["input"]:
+        with open(options["input"], 'rb') as f:
+            data = f.read()
+    result = {"error": None}
+    try:
+        program = interpret.load_program(options["source"])
+    except interpret.LoadError as e:
+        result["error"] = e.message.strip()
+        print(json.dumps(result))
+        return
+
+    # instruction count
+    run = interpret.Interpreter("loop").run(program, stdin = io.BytesIO(data))
+    result["instructions"] = run.steps
+    if run.exit_code != 0:
+        result["error"] = "exit code " + str(run.exit_code) + ": " + run.errors.strip()[-200:]
+        print(json.dumps(result))
+        return
+
+    if options["engine"] == "python":
+        program.python = interpret.compile_python(program)
+    interpreter = interpret.Interpreter(options["engine"], options["optimize"], options["specialize"])
+    execute = None
+    for _ in range(options["repeat"]):
+        start = clock()
+        interpreter.run(program, stdin = io.BytesIO(data))
+        execute = clock() - start if execute == None else min(execute, clock() - start)
+    result["exec"] = execute
+    result["ips"] = result["instructions"] / execute if execute > 0 else 0.0
+    result["memory"] = peak_memory()
+    print(json.dumps(result))
+
+# runs one measurement (load or exec) of benchmark in child process, returns result
+def run_child(phase, xml_file, input_file, options):
+    args = [sys.executable, os.path.abspath(__file__), "--child=" + phase, "--source=" + xml_file, "--int-script=" + options["int_script"],
+            "--engine=" + options["engine"], "--repeat=" + str(options["repeat"])]
+    if input_file:
+        args.append("--input=" + input_file)
+    if options["optimize"]:
+        args.append("--optimize")
+    if options["specialize"]:
+        args.append("--specialize")
+    process = subprocess.run(args, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    try:
+        return json.loads(process.stdout.decode())
+    except ValueError:
+        return {"error": "benchmark process failed (" + str(process.returncode) + "): " + process.stderr.decode().strip()[-200:]}
+
+# measures one benchmark, returns result of both child processes
+def run_benchmark(xml_file, input_file, options):
+    result = run_child("load", xml_file, input_file, options)
+    if not result.get("error"):
+        result.update(run_child("exec", xml_file, input_file, options))
+    return result
+
+# ------ BASELINE -------
+"""
+Baseline is JSON {"engine": ..., "benchmarks": {name: {metric: value}}} written by --save-baseline.
+Metric regresses when it is worse than baseline by more than threshold percent - higher load,
+validate, exec and memories, lower ips. Differences smaller than MIN_DIFFERENCE are noise.
+"""
+METRICS = {
+    # metric: (higher is better, minimal difference)
+    "load": (False, 0.002),
+    "validate": (False, 0.002),
+    "exec": (False, 0.002),
+    "ips": (True, 0.0),
+    "load_memory": (False, 1.0),
+    "memory": (False, 1.0)
+}
+
+# returns list of regressions (name, metric, baseline value, new value, change in percent)
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base == None or result.get("error"):
+            continue
+        for metric, (higher_better, min_difference) in METRICS.items():
+            if metric not in base or metric not in result or base[metric] <= 0:
+                continue
+            old, new = base[metric], result[metric]
+            worse = old - new if higher_better else new - old
+            if worse > min_difference and worse / old * 100 > threshold:
+                regressions.append((name, metric, old, new, (new - old) / old * 100))
+    return regressions
+
+def print_help():
+    print("BENCHMARK of IPPcode18 interpret - measures programs of benchmark directory")
+    print("---------------------------------------------------------------------------")
+    print("Parameters: ./bench.py [options]")
+    print("            ./bench.py --help")
+    print("Options:    --directory=<path>     benchmark folder, natively bench/ next to this script")
+    print("            --int-script=<file>    interpret script file, natively interpret.py next to this script")
+    print("            --engine=<name>        execution engine of interpret (loop, closure or python)")
+    print("            --optimize             runs programs with --optimize")
+    print("            --specialize           runs programs with --specialize")
+    print("            --repeat=<n>           measures each time n times and takes best, natively 3")
+    print("            --baseline=<file>      compares results with JSON baseline")
+    print("            --save-baseline=<file> writes results as JSON baseline")
+    print("            --threshold=<percent>  allowed regression against baseline, natively 10")
+    print("Exit code is 1 when a benchmark fails or regresses.")
+
+# begin of the program
+def main(argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    directory = os.path.join(here, "bench")
+    options = {"int_script": os.path.join(here, "interpret.py"), "engine": "loop", "optimize": False, "specialize": False,
+               "repeat": 3, "source": None, "input": None}
+    baseline_file = None
+    save_file = None
+    threshold = 10.0
+    child = None
+    long_opt = ["help", "directory=", "int-script=", "engine=", "optimize", "specialize", "repeat=", "baseline=",
+                "save-baseline=", "threshold=", "child=", "source=", "input="]
+    try:
+        opts, args = getopt.getopt(argv, "h", long_opt)
+    except getopt.GetoptError:
+        print_help()
+        sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+            sys.exit(EXIT_CODES['OK'])
+        elif opt == "--directory":
+            directory = arg
+        elif opt == "--int-script":
+            options["int_script"] = os.path.abspath(arg)
+        elif opt == "--engine":
+            if arg not in ("loop", "closure", "python"):
+                sys.stderr.write('ERROR: Unknown engine: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            options["engine"] = arg
+        elif opt == "--optimize":
+            options["optimize"] = True
+        elif opt == "--specialize":
+            options["specialize"] = True
+        elif opt == "--repeat":
+            if not arg.isdigit() or int(arg) < 1:
+                sys.stderr.write('ERROR: Invalid number of repeats: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            options["repeat"] = int(arg)
+        elif opt == "--baseline":
+            baseline_file = arg
+        elif opt == "--save-baseline":
+            save_file = arg
+        elif opt == "--threshold":
+            try:
+                threshold = float(arg)
+            except ValueError:
+                sys.stderr.write('ERROR: Invalid threshold: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+        elif opt == "--child":
+            if arg not in ("load", "exec"):
+                sys.stderr.write('ERROR: Unknown measurement: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            child = arg
+        elif opt == "--source":
+            options["source"] = arg
+        elif opt == "--input":
+            options["input"] = arg
+    if args:
+        sys.stderr.write('ERROR: Invalid parameters: ' + str(args) + "\n")
+        sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+
+    if child == "load":
+        measure_load(options)
+        sys.exit(EXIT_CODES['OK'])
+    if child == "exec":
+        measure_exec(options)
+        sys.exit(EXIT_CODES['OK'])
+
+    if not os.path.isdir(directory):
+        sys.stderr.write("ERROR: Given path not found\n")
+        sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
+    if not os.path.exists(options["int_script"]):
+        sys.stderr.write('ERROR: Interpret script not found: ' + str(options["int_script"]) + "\n")
+        sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
+    baseline = None
+    if baseline_file:
+        try:
+            with open(baseline_file) as f:
+                data = json.load(f)
+            baseline = data["benchmarks"]
+        except (OSError, ValueError, KeyError, TypeError):
+            sys.stderr.write('ERROR: Baseline cannot be read: ' + str(baseline_file) + "\n")
+            sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
+        if any(data.get(key) != options[key] for key in ("engine", "optimize", "specialize")):
+            sys.stderr.write('WARNING: Baseline was measured with other engine options: ' + str(baseline_file) + "\n")
+
+    # run
+    results = {}
+    failed = 0
+    print("%-16s %10s %10s %10s %10s %12s %12s %10s" % ("BENCHMARK", "LOAD [s]", "VALID [s]", "LMEM [MiB]", "EXEC [s]", "INSTR", "INSTR/S", "MEM [MiB]"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, xml_file, input_file in load_corpus(directory, work_dir):
+            result = run_benchmark(xml_file, input_file, options)
+            results[name] = result
+            if result.get("error"):
+                failed += 1
+                print("%-16s FAIL %s" % (name, result["error"]))
+            else:
+                print("%-16s %10.4f %10.4f %10.1f %10.4f %12d %12.0f %10.1f" % (name, result["load"], result["validate"], result["load_memory"],
+                                                                               result["exec"], result["instructions"], result["ips"], result["memory"]))
+
+    regressions = compare(results, baseline, threshold) if baseline != None else []
+    for name, metric, old, new, change in regressions:
+        print("REGRESSION %-16s %-8s %12.4f -> %12.4f (%+.1f %%)" % (name, metric, old, new, change))
+    print("BENCH | Benchmarks (" + str(len(results)) + ") | Failed (" + str(failed) + ") | Regressions (" + str(len(regressions)) +
+          ") | Threshold (" + str(threshold) + " %) | Engine (" + options["engine"] + ")")
+
+    if save_file:
+        try:
+            with open(save_file, 'w') as f:
+                json.dump({"engine": options["engine"], "optimize": options["optimize"], "specialize": options["specialize"],
+                           "benchmarks": {name: result for name, result in results.items() if not result.get("error")}}, f, indent = 2)
+        except OSError:
+            sys.stderr.write('ERROR: Baseline cannot be written: ' + str(save_file) + "\n")
+            sys.exit(EXIT_CODES['OUTPUT_FILE_ERROR'])
+    if failed or regressions:
+        sys.exit(EXIT_CODES['REGRESSION'])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -16,12 +16,25 @@ import xml.etree.ElementTree as ET
 import xml.parsers.expat as EX
 import os
 import re
+import hashlib
+import marshal
+import mmap
+import json
+import time
+import io
+import multiprocessing
+import operator
+import threading
+import array
 
 EXIT_CODES = {
     'OK' :                           0,
+    'BATCH_FAILED' :                 1, # some job of batch mode failed
     'INVALID_PARAMETER_ERROR' :     10,
     'INPUT_FILE_ERROR' :            11,
     'OUTPUT_FILE_ERROR' :           12,
+    'SOURCE_HEADER_ERROR' :         20, # --source-format=code, missing .IPPcode18 (as parse.php)
+    'SOURCE_SYNTAX_ERROR' :         21, # --source-format=code, lexical or syntactic error (as parse.php)
     'BAD_XML_FORMAT' :              31, # well-formated, structure of XML
     'LEXYCAL_OR_SYNTACTIC_ERROR' :  32, # invalid lexem for string literal, invalid operate code
     'SEMANTIC_ERROR' :              52,
@@ -33,6 +46,10 @@ EXIT_CODES = {
     'RUNTIME_ERROR_STRING' :        58,
     'RUNTIME_ERROR_REDEFINITION' :  59,
     'UNDEFINED_INSTRUCTION' :       60,
+    'RUNTIME_ERROR_CALL_DEPTH' :    61, # maximum call depth exceeded
+    'RUNTIME_ERROR_STEPS_LIMIT' :   62, # --max-steps exceeded
+    'RUNTIME_ERROR_TIME_LIMIT' :    63, # --max-time exceeded
+    'RUNTIME_ERROR_MEMORY_LIMIT' :  64, # --max-memory exceeded
     'INTERNAL_ERROR' :              99
 
 }
@@ -70,6 +87,8 @@ def dict_find(d, key):
 
 # Represents parameter taken from xml code
 class Parameter:
+    __slots__ = ('par_type', 'text', 'tag')
+
     def __init__(self, tag, text, ptype):
         self.par_type = ptype # type
         self.text = text # value
@@ -98,46 +117,79 @@ class Parameter:
         return False
         # believe strings, labels and variable names are corrected in parser
 
-# Represents one variable stored in a frame
-class Variable:
-    def __init__(self, name, value = None, vtype = None):
-        self.name = name
-        self.value = value
-        self.var_type = vtype
-
-    # modifies given variable with new type and value
-    def modify(self, value, vtype):
-        self.value = value
-        self.var_type = vtype
-# Frame represents table of current available variables
+# VALUES
+"""
+Values are stored as native Python objects together with type tag:
+    int    -> int
+    bool   -> bool
+    string -> str
+Uninitialized variable has value None and type None.
+"""
+
+# converts literal text (already checked by Parameter.check_type) to native value
+def literal_value(text, par_type):
+    if par_type == "int":
+        return int(text)
+    if par_type == "bool":
+        return text == "true"
+    return text
+
+# returns value as text, bool as true or false like in IPPcode18
+def value_text(value, var_type):
+    if var_type == "bool":
+        return "true" if value else "false"
+    return str(value)
+
+# returns operand as written in source (error messages, DPRINT), canonical constant has no text
+def operand_text(operand):
+    if operand[0] != None or len(operand) > 3:
+        return operand[-1]
+    return value_text(operand[1], operand[2])
+
+# maps variable names of one frame kind to slot indexes, filled when program is compiled
+class SymbolTable:
+    def __init__(self, names = None):
+        self.names = list(names or []) # slot -> name
+        self.slots = {name: slot for slot, name in enumerate(self.names)} # name -> slot
+
+    # returns slot of given name, new slot is assigned to unknown name
+    def slot(self, name):
+        s = self.slots.get(name)
+        if s is None:
+            s = len(self.names)
+            self.slots[name] = s
+            self.names.append(name)
+        return s
+
+# marks slot without defined variable
+UNDEFINED = False
+
+# Frame represents table of current available variables, one slot for each name in SymbolTable
 class Frame:
-    def __init__(self):
-        self.table = []
+    def __init__(self, symbols: SymbolTable):
+        self.symbols = symbols
+        self.values = [None] * len(symbols.names)
+        self.types = [UNDEFINED] * len(symbols.names)
 
-    # creates Variable instance and adds it to Frame, raises ERROR if variable already defined
-    def add_var(self, name):
-        if name in self.table:
-            sys.stderr.write('ERROR: Variable already exists: ' + str(name) + '\n')
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_REDEFINITION'])
-        else:
-            var = Variable(name) # creates variable
-            self.table.append(var)
-
-    # modifies Variable according to given name, value and type, raises ERROR if variable not found
-    def mod_var(self, name, value, var_type):
-        for var in self.table:
-            if var.name == name:
-                var.value = value
-                var.var_type = var_type
-                return True
-        sys.stderr.write('ERROR: Variable not defined: ' + str(name) + '\n')
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_VARIABLE'])
-
-    def find_var(self, name):
-        for var in self.table:
-            if var.name == name:
-                return var
-        return False # variable not defined
+    # defines variable in given slot, raises ERROR if variable already defined
+    def add_var(self, slot):
+        if self.types[slot] is not UNDEFINED:
+            runtime_error('RUNTIME_ERROR_REDEFINITION', 'ERROR: Variable already exists: ' + str(self.symbols.names[slot]) + '\n')
+        self.values[slot] = None
+        self.types[slot] = None
+
+    # modifies variable in given slot with new type and value
+    def modify(self, slot, value, var_type):
+        self.values[slot] = value
+        self.types[slot] = var_type
+
+    # checks if variable in given slot is defined, returns True x False
+    def defined(self, slot):
+        return self.types[slot] is not UNDEFINED
+
+    # returns list of defined variables as (NAME, VALUE, TYPE)
+    def variables(self):
+        return [(self.symbols.names[slot], self.values[slot], self.types[slot]) for slot in range(len(self.types)) if self.types[slot] is not UNDEFINED]
 # local frame
 class LocalFrame(Frame):
     ...
@@ -173,11 +225,39 @@ class FrameStack:
             return self.frame_arr[-1]
         else:
             return None
-# stack for jumping
+# free local frames - frames dropped from TF by POPFRAME are reused by CREATEFRAME instead
+# of allocating new ones (TF replaced by CREATEFRAME is cleared in place), all local frames
+# have the same shape
+class FramePool:
+    MAX_FREE = 64
+
+    def __init__(self, symbols: SymbolTable):
+        self.symbols = symbols
+        self.free = []
+        self.blank_values = [None] * len(symbols.names)
+        self.blank_types = [UNDEFINED] * len(symbols.names)
+
+    # returns empty Frame
+    def acquire(self):
+        if self.free:
+            frame = self.free.pop()
+            frame.values[:] = self.blank_values
+            frame.types[:] = self.blank_types
+            return frame
+        return Frame(self.symbols)
+
+    # takes Frame which is not referenced any more
+    def release(self, frame):
+        if len(self.free) < FramePool.MAX_FREE:
+            self.free.append(frame)
+
+# stack for jumping, holds indexes of instructions to return to
 class CallStack:
+    MAX_DEPTH = 1000000 # natively, --max-call-depth
 
-    def __init__(self):
+    def __init__(self, max_depth = MAX_DEPTH):
         self.call_arr = []
+        self.max_depth = max_depth
 
     # checks if Stack is empty, returns True x False
     def empty(self):
@@ -197,33 +277,158 @@ class CallStack:
             return o
         else:
             return False
-# stack to store data
+# stack to store data, values and types are kept in parallel lists
 class DataStack:
 
     def __init__(self):
-        self.data_arr = []
+        self.values = []
+        self.types = []
 
     # checks if Stack is empty, returns True x False
     def empty(self):
-        if len(self.data_arr) == 0:
+        if len(self.values) == 0:
             return True
         else:
             return False
 
-    # pushes variable (or symbol), no return
-    def push(self, var):
-        self.data_arr.append(var)
+    # pushes value with its type, no return
+    def push(self, value, vtype):
+        self.values.append(value)
+        self.types.append(vtype)
 
-    # pops variable (or symbol), returns variable (or symbol) or False when empty
+    # pops value, returns (value, type) or False when empty
     def pop(self):
-        if (len(self.data_arr) > 0):
-            var = self.data_arr.pop()
-            return var
+        if (len(self.values) > 0):
+            return self.values.pop(), self.types.pop()
         else:
             return False
 
+# string variable changed by SETCHAR - characters are kept in list, so reading and replacing one
+# character is O(1), str is joined only when whole value is needed and kept until next change
+class MutableString:
+    __slots__ = ('chars', 'text')
+
+    def __init__(self, s):
+        self.chars = list(s)
+        self.text = s
+
+    def __str__(self):
+        if self.text is None:
+            self.text = "".join(self.chars)
+        return self.text
+
+    def __len__(self):
+        return len(self.chars)
+
+    def __getitem__(self, index):
+        return self.chars[index]
+
+    def __setitem__(self, index, char):
+        self.chars[index] = char
+        self.text = None
+
+# variable names of global frame and of local / temporary frames (set by link_program)
+gSymbols = SymbolTable()
+lSymbols = SymbolTable()
+# buffered stdout of interpreted program
+class Output:
+    BUFFER_SIZE = 65536 # characters
+
+    def __init__(self, stream = None, buffer_size = BUFFER_SIZE, line = False):
+        self.stream = stream # binary stream, natively sys.stdout.buffer
+        self.buffer_size = buffer_size
+        self.line = line # flush after each WRITE
+        self.parts = []
+        self.size = 0
+
+    # adds text to buffer, flushes it when full (or always in line mode)
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.line or self.size >= self.buffer_size:
+            self.flush()
+
+    # encodes and writes whole buffer to stream
+    def flush(self):
+        if self.parts:
+            stream = self.stream or sys.stdout.buffer
+            stream.write("".join(self.parts).encode())
+            stream.flush()
+            self.parts = []
+            self.size = 0
+
+# input of interpreted program (READ), stream is read in big chunks or file is mapped to memory,
+# lines are split only when READ asks for them
+class Input:
+    CHUNK_SIZE = 65536 # bytes
+
+    def __init__(self, stream = None):
+        self.stream = stream # binary stream, natively sys.stdin.buffer
+        self.buffer = b"" # bytes or mmap
+        self.pos = 0 # start of next line in buffer
+        self.consumed = 0 # bytes dropped from buffer before its start
+        self.eof = False
+
+    # maps whole file to memory, so no more reading is needed, files which cannot be mapped
+    # (empty files, pipes, devices) are read in chunks
+    def open_file(self, path):
+        f = open(path, 'rb')
+        self.buffer = b""
+        self.pos = 0
+        self.consumed = 0
+        try:
+            self.buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            self.eof = True
+            f.close()
+        except (ValueError, OSError):
+            self.stream = f
+            self.eof = False
+
+    # reads next chunk from stream, returns False at end of stream
+    def fill(self):
+        stream = self.stream or sys.stdin.buffer
+        chunk = stream.read1(Input.CHUNK_SIZE) if hasattr(stream, 'read1') else stream.read(Input.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.consumed += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    # returns next line without line ending \n or \r\n (as input() does) or None at end of input
+    def readline(self):
+        start = self.pos
+        end = self.buffer.find(b"\n", start)
+        while end < 0 and not self.eof:
+            searched = len(self.buffer) - self.pos
+            if not self.fill():
+                break
+            start = 0
+            end = self.buffer.find(b"\n", searched)
+        if end < 0: # last line without line ending
+            if start >= len(self.buffer):
+                return None
+            end = len(self.buffer)
+        self.pos = end + 1
+        if end > start and self.buffer[end - 1] == 13: # \r
+            end -= 1
+        return self.buffer[start:end].decode()
+
+    # returns number of bytes read by program (position in input)
+    def position(self):
+        return self.consumed + self.pos
+
+    # skips count bytes of input (continuation of run from checkpoint)
+    def skip(self, count):
+        while len(self.buffer) - self.pos < count and not self.eof:
+            if not self.fill():
+                break
+        self.pos = min(self.pos + count, len(self.buffer))
+
+# run state of interpreted program, created again for each run by init_run
 # definition of one global frame
-gFrame = GlobalFrame()
+gFrame = None
 # definition of one local frame
 lFrame = None
 # definition of one temporary frame
@@ -232,488 +437,812 @@ tFrame = None
 fStack = FrameStack()
 # definition of call stack
 cStack = CallStack()
+# definition of free local frames
+frame_pool = FramePool(lSymbols)
 # definition of data stack
 dStack = DataStack()
-# labels dictionary prepared for jumps
-labels = {}
+# definition of program output
+output = Output()
+# definition of program input
+program_input = Input()
+# text stream of error messages, DPRINT and BREAK, natively sys.stderr
+error_output = sys.stderr
 
 def print_help():
     print("INTERPRET for IPPcode18 - interprets xml file given from parse.php script")
     print("-------------------------------------------------------------------------")
     print("Parameters: ./interpret.py --source=<xml_source_file>")
     print("            ./interpret.py --help")
+    print("            --input=<file>       input of READ instructions, natively stdin")
+    print("            --source-format=xml|code  source is XML of parse.php (default) or IPPcode18 code")
+    print("            --validate-jobs=<n>  validates big XML source on n processes (default: 1)")
+    print("Options:    --compile-only       only validates source, with --cache or --cache-dir stores it to cache")
+    print("            --cache              enables cache of validated programs in ~/.cache/ipp-interpret")
+    print("            --cache-dir=<dir>    enables cache of validated programs in given directory")
+    print("            --cache-size=<MiB>   cache size limit, natively " + str(CACHE_MAX_SIZE))
+    print("            --no-cache           disables cache (default)")
+    print("            --optimize           fuses common instruction sequences to superinstructions")
+    print("            --engine=<name>      execution engine: loop (default), closure or python")
+    print("            --emit-python=<file> writes program translated to Python (see --engine=python) to file")
+    print("            --max-call-depth=<n> maximum depth of CALL, deeper call ends with exit code 61 (default: " + str(CallStack.MAX_DEPTH) + ")")
+    print("            --max-steps=<n>      maximum number of executed instructions, exit code 62")
+    print("            --max-time=<s>       maximum run time in seconds, exit code 63")
+    print("            --max-memory=<MiB>   maximum approximate memory of frames and data stack, exit code 64")
+    print("            --checkpoint-file=<f> file of checkpoints (--checkpoint-every) and of --resume")
+    print("            --checkpoint-every=<n> writes run state to checkpoint file every n instructions")
+    print("            --resume             continues run from checkpoint file")
+    print("            --specialize         runs instructions with proven operand types without checks")
+    print("            --analysis-report=<f> writes JSON report of specialised instructions to file")
+    print("            --profile=<path>     writes execution profile to <path>.json and <path>.txt (loop engine)")
+    print("            --batch=<manifest>   runs all jobs of JSON manifest, see BATCH MODE")
+    print("            --jobs=<n>           number of worker processes in batch mode (default: CPU count)")
+    print("            --batch-report=<f>   writes JSON results of batch mode to file")
+    print("            --output-buffer=<N>  size of output buffer in characters, natively " + str(Output.BUFFER_SIZE))
+    print("            --flush=line|block   flushes output after each WRITE or when buffer is full,")
+    print("                                 natively line for terminal, block otherwise")
     print("Project to IPP - Brno University of Technology, Faculty of Information Technology")
     print("---------------------------------------------------------------------------------")
     print("(c) Jan Kubica, xkubic39@stud.fit.vutbr.cz, April 2018")
 
-def MOVE(order, arg_list):
-    var = resolve_parameter_var(order, "MOVE", arg_list[0])
-    s_val, s_type = resolve_parameter_symb(order, "MOVE", arg_list[1])
+# COMPILED INSTRUCTIONS
+"""
+Every handler gets one compiled instruction (tuple) from link_program():
+    (handler, opcode, order, operand1, operand2, operand3)
+- var operand    -> (frame, slot, text), frame is 'GF', 'LF' or 'TF', slot from gSymbols or lSymbols
+- symb operand   -> variable as above or constant (None, value, type), value is native (see VALUES),
+                    constant written differently than value_text() has text appended (int@+1)
+- label operand  -> index of instruction following the LABEL
+- type operand   -> type name as string
+Handler returns None (continue with next instruction), index of next instruction
+(jumps) or TRAP_BREAK when it needs state of the dispatch loop.
+"""
+TRAP_BREAK = -1
+
+# var, symb
+def MOVE(ins):
+    _, _, order, dst, src = ins
+    frame = resolve_var(order, "MOVE", dst)
+    s_val, s_type = resolve_symb(order, "MOVE", src)
     if s_val == None:
         s_val = ""
-    var.modify(s_val, s_type)
+    frame.modify(dst[1], s_val, s_type)
 #
-def CREATEFRAME(order, arg_list):
+def CREATEFRAME(ins):
     global tFrame
-    tFrame = Frame()
+    if tFrame is None:
+        tFrame = frame_pool.acquire()
+    else: # old TF is not referenced any more, it is cleared and reused
+        tFrame.values[:] = frame_pool.blank_values
+        tFrame.types[:] = frame_pool.blank_types
 #
-def PUSHFRAME(order, arg_list):
+def PUSHFRAME(ins):
     global fStack, tFrame, lFrame
     if tFrame != None:
         fStack.push(tFrame)
     else:
-        sys.stderr.write('ERROR: PUSHFRAME (order ' + str(order) + ') tries to push nonallocated Frame\n')
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME']) 
+        runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: PUSHFRAME (order ' + str(ins[2]) + ') tries to push nonallocated Frame\n')
     lFrame = tFrame
     tFrame = None
 #
-def POPFRAME(order, arg_list):
+def POPFRAME(ins):
     global tFrame, fStack, lFrame
+    if tFrame != None:
+        frame_pool.release(tFrame)
     tFrame = fStack.pop()
     if tFrame == False:
-        sys.stderr.write('ERROR: POPFRAME (order ' + str(order) + ') reaches empty Frame Stack\n')
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME'])
+        runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: POPFRAME (order ' + str(ins[2]) + ') reaches empty Frame Stack\n')
     lFrame = fStack.get_lFrame()
 # var
-def DEFVAR(order, arg_list):
+def DEFVAR(ins):
     global lFrame, gFrame, tFrame
-    var = arg_list[0]
-    if var.text[:3] == 'GF@':
-        gFrame.add_var(var.text[3:])
-    if var.text[:3] == 'LF@':
+    _, _, order, (frame, slot, text) = ins
+    if frame == 'GF':
+        gFrame.add_var(slot)
+    elif frame == 'LF':
         if lFrame != None:
-            lFrame.add_var(var.text[3:])
+            lFrame.add_var(slot)
         else:
-            sys.stderr.write('ERROR: DEFVAR (order ' + order + ') tries to save variable ' + str(var.text) + ' to nonallocated Local Frame\n')
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME'])
-    if var.text[:3] == 'TF@':
+            runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: DEFVAR (order ' + str(order) + ') tries to save variable ' + str(text) + ' to nonallocated Local Frame\n')
+    else:
         if tFrame != None:
-            tFrame.add_var(var.text[3:])
+            tFrame.add_var(slot)
         else:
-            sys.stderr.write('ERROR: DEFVAR (order ' + order + ') tries to save variable ' + str(var.text) + ' to nonallocated Temporary Frame\n')
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME'])
-# label
-def CALL(order, arg_list):
-    global labels, cStack
-    label = arg_list[0]
-    cStack.push(order)
-    return int(labels[label.text])
+            runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: DEFVAR (order ' + str(order) + ') tries to save variable ' + str(text) + ' to nonallocated Temporary Frame\n')
+# label (return index added by compiler)
+def CALL(ins):
+    if len(cStack.call_arr) >= cStack.max_depth:
+        runtime_error('RUNTIME_ERROR_CALL_DEPTH', 'ERROR: CALL (order ' + str(ins[2]) + ') exceeds maximum call depth ' + str(cStack.max_depth) + '\n')
+    cStack.push(ins[4])
+    return ins[3]
 #
-def RETURN(order, arg_list):
-    global cStack
+def RETURN(ins):
     if not cStack.empty():
-        l = cStack.pop()
-        return l
+        return cStack.pop()
     """
     else:
-        sys.stderr.write('ERROR: RETURN (order ' + str(order) + ') reaches empty Call Stack\n')
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_VALUE'])
+        runtime_error('RUNTIME_ERROR_VALUE', 'ERROR: RETURN (order ' + str(ins[2]) + ') reaches empty Call Stack\n')
     """
 # symb
-def PUSHS(order, arg_list):
-    global dStack
-    v, t = resolve_parameter_symb(order, "PUSHS", arg_list[0])
-    var = Variable("none", v, t)
-    dStack.push(var)
+def PUSHS(ins):
+    v, t = resolve_symb(ins[2], "PUSHS", ins[3])
+    dStack.push(v, t)
 # var
-def POPS(order, arg_list):
-    global dStack, gFrame, lFrame
+def POPS(ins):
+    _, _, order, dst = ins
     pvar = dStack.pop()
-    if pvar == False:
-        sys.stderr.write('ERROR: POPS (order ' + str(order) + ') reaches empty Stack\n')
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_VALUE'])      
-    var = resolve_parameter_var(order, "POPS", arg_list[0])
-    var.modify(pvar.value, pvar.var_type)
+    if pvar is False:
+        runtime_error('RUNTIME_ERROR_VALUE', 'ERROR: POPS (order ' + str(order) + ') reaches empty Stack\n')
+    frame = resolve_var(order, "POPS", dst)
+    frame.modify(dst[1], pvar[0], pvar[1])
 # var, symb1, symb2
-def ADD(order, arg_list):
-    var = resolve_parameter_var(order, "ADD", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "ADD", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "ADD", arg_list[2])
+def ADD(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "ADD", dst)
+    symb1_v, symb1_t = resolve_symb(order, "ADD", src1)
+    symb2_v, symb2_t = resolve_symb(order, "ADD", src2)
     if symb1_t == "int" and symb2_t == "int":
-        result = int(symb1_v) + int(symb2_v)
-        var.modify(result, "int")
+        frame.modify(dst[1], symb1_v + symb2_v, "int")
     else:
-        sys.stderr.write("ERROR: ADD (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "ADD", symb1_t, symb2_t)
 # var, symb1, symb2
-def SUB(order, arg_list):
-    var = resolve_parameter_var(order, "SUB", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "SUB", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "SUB", arg_list[2])
+def SUB(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "SUB", dst)
+    symb1_v, symb1_t = resolve_symb(order, "SUB", src1)
+    symb2_v, symb2_t = resolve_symb(order, "SUB", src2)
     if symb1_t == "int" and symb2_t == "int":
-        result = int(symb1_v) - int(symb2_v)
-        var.modify(result, "int")
+        frame.modify(dst[1], symb1_v - symb2_v, "int")
     else:
-        sys.stderr.write("ERROR: SUB (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "SUB", symb1_t, symb2_t)
 # var, symb1, symb2
-def MUL(order, arg_list):
-    var = resolve_parameter_var(order, "MUL", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "MUL", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "MUL", arg_list[2])
+def MUL(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "MUL", dst)
+    symb1_v, symb1_t = resolve_symb(order, "MUL", src1)
+    symb2_v, symb2_t = resolve_symb(order, "MUL", src2)
     if symb1_t == "int" and symb2_t == "int":
-        result = int(symb1_v) * int(symb2_v)
-        var.modify(result, "int")
+        frame.modify(dst[1], symb1_v * symb2_v, "int")
     else:
-        sys.stderr.write("ERROR: MUL (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "MUL", symb1_t, symb2_t)
 # var, symb1, symb2
-def IDIV(order, arg_list):
-    var = resolve_parameter_var(order, "IDIV", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "IDIV", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "IDIV", arg_list[2])
+def IDIV(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "IDIV", dst)
+    symb1_v, symb1_t = resolve_symb(order, "IDIV", src1)
+    symb2_v, symb2_t = resolve_symb(order, "IDIV", src2)
     if symb1_t == "int" and symb2_t == "int":
         try:
-            result = int(symb1_v) // int(symb2_v)
-            var.modify(result, "int")
+            frame.modify(dst[1], symb1_v // symb2_v, "int")
         except ZeroDivisionError:
-            sys.stderr.write("ERROR: IDIV (order " + str(order) + ") Division by zero!\n")
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_ZERO'])
+            runtime_error('RUNTIME_ERROR_ZERO', "ERROR: IDIV (order " + str(order) + ") Division by zero!\n")
     else:
-        sys.stderr.write("ERROR: IDIV (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "IDIV", symb1_t, symb2_t)
 # var, symb1, symb2
-def LT(order, arg_list):
-    var = resolve_parameter_var(order, "LT", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "LT", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "LT", arg_list[2])
-
+def LT(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "LT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "LT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "LT", src2)
     # --- COMPARATION
     if symb1_t == symb2_t: # same types
-        if symb1_t == "int":
-            var.modify("true", "bool") if int(symb1_v) < int(symb2_v) else var.modify("false", "bool")
-        if symb1_t == "bool":
-            var.modify("true", "bool") if symb1_v < symb2_v else var.modify("false", "bool")
-        if symb1_t == "string":
-            var.modify("true", "bool") if symb1_v < symb2_v else var.modify("false", "bool")
+        if symb1_t != None:
+            frame.modify(dst[1], symb1_v < symb2_v, "bool")
     else:
-        sys.stderr.write("ERROR: LT (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "LT", symb1_t, symb2_t)
 # var, symb1, symb2
-def GT(order, arg_list):
-    var = resolve_parameter_var(order, "GT", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "GT", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "GT", arg_list[2])
-
+def GT(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "GT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "GT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "GT", src2)
     # --- COMPARATION
     if symb1_t == symb2_t: # same types
-        if symb1_t == "int":
-            var.modify("true", "bool") if int(symb1_v) > int(symb2_v) else var.modify("false", "bool")
-        if symb1_t == "bool":
-            var.modify("true", "bool") if symb1_v > symb2_v else var.modify("false", "bool")
-        if symb1_t == "string":
-            var.modify("true", "bool") if symb1_v > symb2_v else var.modify("false", "bool")
+        if symb1_t != None:
+            frame.modify(dst[1], symb1_v > symb2_v, "bool")
     else:
-        sys.stderr.write("ERROR: GT (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "GT", symb1_t, symb2_t)
 # var, symb1, symb2
-def EQ(order, arg_list):
-    var = resolve_parameter_var(order, "EQ", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "EQ", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "EQ", arg_list[2])
-
+def EQ(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "EQ", dst)
+    symb1_v, symb1_t = resolve_symb(order, "EQ", src1)
+    symb2_v, symb2_t = resolve_symb(order, "EQ", src2)
     # --- COMPARATION
     if symb1_t == symb2_t: # same types
-        if symb1_t == "int":
-            var.modify("true", "bool") if int(symb1_v) == int(symb2_v) else var.modify("false", "bool")
-        if symb1_t == "bool":
-            var.modify("true", "bool") if symb1_v == symb2_v else var.modify("false", "bool")
-        if symb1_t == "string":
-            var.modify("true", "bool") if symb1_v == symb2_v else var.modify("false", "bool")
+        if symb1_t != None:
+            frame.modify(dst[1], symb1_v == symb2_v, "bool")
     else:
-        sys.stderr.write("ERROR: EQ (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "EQ", symb1_t, symb2_t)
 # var, symb1, symb2
-def AND(order, arg_list):
-    var = resolve_parameter_var(order, "AND", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "AND", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "AND", arg_list[2])
+def AND(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "AND", dst)
+    symb1_v, symb1_t = resolve_symb(order, "AND", src1)
+    symb2_v, symb2_t = resolve_symb(order, "AND", src2)
     # --- COMPARATION
     if symb1_t == "bool" and symb2_t == "bool":
-        if symb1_v == "true" and symb2_v == "true":
-            var.modify("true", "bool")
-        else:
-            var.modify("false", "bool")
+        frame.modify(dst[1], symb1_v and symb2_v, "bool")
     else:
-        sys.stderr.write("ERROR: AND (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "AND", symb1_t, symb2_t)
 # var, symb1, symb2
-def OR(order, arg_list):
-    var = resolve_parameter_var(order, "OR", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "OR", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "OR", arg_list[2])
+def OR(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "OR", dst)
+    symb1_v, symb1_t = resolve_symb(order, "OR", src1)
+    symb2_v, symb2_t = resolve_symb(order, "OR", src2)
     # --- COMPARATION
     if symb1_t == "bool" and symb2_t == "bool":
-        if symb1_v == "true" or symb2_v == "true":
-            var.modify("true", "bool")
-        else:
-            var.modify("false", "bool")
+        frame.modify(dst[1], symb1_v or symb2_v, "bool")
     else:
-        sys.stderr.write("ERROR: OR (order " + str(order) + ") has incompatible argument types '" + str(symb1_t) + "' and '" + str(symb2_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        operand_types_error(order, "OR", symb1_t, symb2_t)
 # var, symb
-def NOT(order, arg_list):
-    var = resolve_parameter_var(order, "NOT", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "NOT", arg_list[1])
+def NOT(ins):
+    _, _, order, dst, src1 = ins
+    frame = resolve_var(order, "NOT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "NOT", src1)
     # --- COMPARATION
     if symb1_t == "bool":
-        if symb1_v == "true":
-            var.modify("false", "bool")
-        else:
-            var.modify("true", "bool")
+        frame.modify(dst[1], not symb1_v, "bool")
     else:
-        sys.stderr.write("ERROR: NOT (order " + str(order) + ") has incompatible argument type '" + str(symb1_t) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: NOT (order " + str(order) + ") has incompatible argument type '" + str(symb1_t) + "'\n")
 # var, symb
-def INT2CHAR(order, arg_list):
-    var = resolve_parameter_var(order, "INT2CHAR", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "INT2CHAR", arg_list[1])
+def INT2CHAR(ins):
+    _, _, order, dst, src1 = ins
+    frame = resolve_var(order, "INT2CHAR", dst)
+    symb1_v, symb1_t = resolve_symb(order, "INT2CHAR", src1)
     if symb1_t != "int":
-        sys.stderr.write("ERROR: INT2CHAR (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not integer type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: INT2CHAR (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not integer type\n")
     try:
-        c = chr(int(symb1_v))
-        var.modify(c, "string")
+        frame.modify(dst[1], chr(symb1_v), "string")
     except ValueError:
-        sys.stderr.write("ERROR: INT2CHAR (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' - index out of range\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_STRING'])
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: INT2CHAR (order " + str(order) + ") second argument '" + operand_text(src1) + "' - index out of range\n")
 # var, symb1, symb2
-def STRI2INT(order, arg_list):
-    var = resolve_parameter_var(order, "STRI2INT", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "STRI2INT", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "STRI2INT", arg_list[2])
+def STRI2INT(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "STRI2INT", dst)
+    symb1_v, symb1_t = resolve_chars(order, "STRI2INT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "STRI2INT", src2)
     if symb1_t != "string":
-        sys.stderr.write("ERROR: STRI2INT (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: STRI2INT (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not string type\n")
     if symb2_t != "int":
-        sys.stderr.write("ERROR: STRI2INT (order " + str(order) + ") third argument '" + str(arg_list[2].text) + "' is not integer type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: STRI2INT (order " + str(order) + ") third argument '" + operand_text(src2) + "' is not integer type\n")
     try:
-        s2 = list(symb1_v)
-        c = s2[int(symb2_v)]
-        result = ord(c)
-        var.modify(result, "int")
+        frame.modify(dst[1], ord(symb1_v[symb2_v]), "int")
     except IndexError:
-        sys.stderr.write("ERROR: STRI2INT (order " + str(order) + ") second argument '" + str(arg_list[2].text) + "' - index " + str(symb2_v) + " out of range\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_STRING'])
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: STRI2INT (order " + str(order) + ") second argument '" + operand_text(src2) + "' - index " + str(symb2_v) + " out of range\n")
 # var, type
-def READ(order, arg_list):
-    var = resolve_parameter_var(order, "READ", arg_list[0])
-    typ = arg_list[1]
-    try:
-        s = input()
-    except EOFError:
+def READ(ins):
+    _, _, order, dst, typ = ins
+    frame = resolve_var(order, "READ", dst)
+    s = program_input.readline()
+    if s == None: # end of input
         s = ""
-        if typ == "int":
-            s = 0
 
-    if typ.text == "int":
-        if is_int(s):
-            var.modify(int(s), "int")
-        else:
-            var.modify(int(0), "int")
-    elif typ.text == "string":
-        var.modify(s, "string")
-    elif typ.text == "bool":
-        if s.lower() == "true":
-            var.modify("true", "bool")
-        else:
-            var.modify("false", "bool")
+    if typ == "int":
+        try:
+            frame.modify(dst[1], int(s), "int")
+        except ValueError:
+            frame.modify(dst[1], 0, "int")
+    elif typ == "string":
+        frame.modify(dst[1], s, "string")
+    elif typ == "bool":
+        frame.modify(dst[1], s.lower() == "true", "bool")
     else:
-        sys.stderr.write("ERROR: READ (order " + str(order) + ") type not recognized\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: READ (order " + str(order) + ") type not recognized\n")
 # symb
-def WRITE(order, arg_list):
-    symb1_v, symb1_t = resolve_parameter_symb(order, "WRITE", arg_list[0])
-    if symb1_v != None:
-        if symb1_t == "int":
-            print(int(symb1_v))
-        else:
-            print(symb1_v)
+def WRITE(ins):
+    symb1_v, symb1_t = resolve_symb(ins[2], "WRITE", ins[3])
+    if symb1_t == "bool":
+        output.write("true\n" if symb1_v else "false\n")
+    elif symb1_v != None:
+        output.write(str(symb1_v) + "\n")
     else:
-        print("")
+        output.write("\n")
 # var, symb1, symb2
-def CONCAT(order, arg_list):
-    var = resolve_parameter_var(order, "CONCAT", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "CONCAT", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "CONCAT", arg_list[2])
+def CONCAT(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "CONCAT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "CONCAT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "CONCAT", src2)
     if symb1_t != "string":
-        sys.stderr.write("ERROR: CONCAT (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: CONCAT (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not string type\n")
     if symb2_t != "string":
-        sys.stderr.write("ERROR: CONCAT (order " + str(order) + ") third argument '" + str(arg_list[2].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
-    result = symb1_v + symb2_v
-    var.modify(result, "string")
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: CONCAT (order " + str(order) + ") third argument '" + operand_text(src2) + "' is not string type\n")
+    frame.modify(dst[1], symb1_v + symb2_v, "string")
 # var, symb
-def STRLEN(order, arg_list):
-    var = resolve_parameter_var(order, "STRLEN", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "STRLEN", arg_list[1])
+def STRLEN(ins):
+    _, _, order, dst, src1 = ins
+    frame = resolve_var(order, "STRLEN", dst)
+    symb1_v, symb1_t = resolve_chars(order, "STRLEN", src1)
     if symb1_t != "string":
-        sys.stderr.write("ERROR: STRLEN (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
-    result = len(symb1_v)
-    var.modify(result,"int")
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: STRLEN (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not string type\n")
+    frame.modify(dst[1], len(symb1_v), "int")
 # var, symb1, symb2
-def GETCHAR(order, arg_list):
-    var = resolve_parameter_var(order, "GETCHAR", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "GETCHAR", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "GETCHAR", arg_list[2])
+def GETCHAR(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "GETCHAR", dst)
+    symb1_v, symb1_t = resolve_chars(order, "GETCHAR", src1)
+    symb2_v, symb2_t = resolve_symb(order, "GETCHAR", src2)
     if symb1_t != "string":
-        sys.stderr.write("ERROR: GETCHAR (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: GETCHAR (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not string type\n")
     if symb2_t != "int":
-        sys.stderr.write("ERROR: GETCHAR (order " + str(order) + ") third argument '" + str(arg_list[2].text) + "' is not integer type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
-    result = var.value
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: GETCHAR (order " + str(order) + ") third argument '" + operand_text(src2) + "' is not integer type\n")
     try:
-        result = list(symb1_v)
-        c = result[int(symb2_v)]
-        var.modify(c, "string")
+        frame.modify(dst[1], symb1_v[symb2_v], "string")
     except IndexError:
-        sys.stderr.write("ERROR: GETCHAR (order " + str(order) + ") second argument '" + str(arg_list[2].text) + "' - index " + str(symb2_v) + " out of range\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_STRING'])
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: GETCHAR (order " + str(order) + ") second argument '" + operand_text(src2) + "' - index " + str(symb2_v) + " out of range\n")
 # var, symb1, symb2
-def SETCHAR(order, arg_list):
-    var = resolve_parameter_var(order, "SETCHAR", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "SETCHAR", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "SETCHAR", arg_list[2])
-    if var.var_type != "string":
-        sys.stderr.write("ERROR: SETCHAR (order " + str(order) + ") first argument '" + str(arg_list[0].text) + "' (" + str(var.var_type) + ") is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+def SETCHAR(ins):
+    _, _, order, dst, src1, src2 = ins
+    frame = resolve_var(order, "SETCHAR", dst)
+    symb1_v, symb1_t = resolve_symb(order, "SETCHAR", src1)
+    symb2_v, symb2_t = resolve_symb(order, "SETCHAR", src2)
+    slot = dst[1]
+    if frame.types[slot] != "string":
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: SETCHAR (order " + str(order) + ") first argument '" + operand_text(dst) + "' (" + str(frame.types[slot]) + ") is not string type\n")
     if symb1_t != "int":
-        sys.stderr.write("ERROR: SETCHAR (order " + str(order) + ") second argument '" + str(arg_list[1].text) + "' is not integer type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: SETCHAR (order " + str(order) + ") second argument '" + operand_text(src1) + "' is not integer type\n")
     if symb2_t != "string":
-        sys.stderr.write("ERROR: SETCHAR (order " + str(order) + ") third argument '" + str(arg_list[2].text) + "' is not string type\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: SETCHAR (order " + str(order) + ") third argument '" + operand_text(src2) + "' is not string type\n")
     if len(symb2_v) < 1:
-        sys.stderr.write("ERROR: SETCHAR (order " + str(order) + ") third argument '" + str(arg_list[2].text) + "' is empty string\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_STRING'])
-    c = symb2_v[0]
-    result = var.value
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: SETCHAR (order " + str(order) + ") third argument '" + operand_text(src2) + "' is empty string\n")
     try:
-        result = list(result)
-        result[int(symb1_v)] = c
-        result = "".join(result)
-        var.modify(result, var.var_type)
+        value = frame.values[slot]
+        if value.__class__ is not MutableString:
+            value = MutableString(value)
+            frame.values[slot] = value
+        value[symb1_v] = symb2_v[0]
     except IndexError:
-        sys.stderr.write("ERROR: SETCHAR (order " + str(order) + ") second argument '" + str(arg_list[2].text) + "' - index " + str(symb2_v) + " out of range\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_STRING'])
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: SETCHAR (order " + str(order) + ") second argument '" + operand_text(src2) + "' - index " + str(symb2_v) + " out of range\n")
 # var, symb
-def TYPE(order, arg_list):
-    var = resolve_parameter_var(order, "TYPE", arg_list[0])
-    symb1_v, symb1_t = resolve_parameter_symb(order, "TYPE", arg_list[1])
-    var.modify(symb1_t, "string")
+def TYPE(ins):
+    _, _, order, dst, src1 = ins
+    frame = resolve_var(order, "TYPE", dst)
+    symb1_v, symb1_t = resolve_symb(order, "TYPE", src1)
+    frame.modify(dst[1], symb1_t or "", "string")
 # label
-def LABEL(order, arg_list):
+def LABEL(ins):
     ...
 # label
-def JUMP(order, arg_list):
-    global labels
-    label = arg_list[0]
-    return int(labels[label.text])
+def JUMP(ins):
+    return ins[3]
 # label, symb1, symb2
-def JUMPIFEQ(order, arg_list):
-    global labels
-    symb1_v, symb1_t = resolve_parameter_symb(order, "JUMPIFEQ", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "JUMPIFEQ", arg_list[2])
-    # --- RESOLVE label
-    label = arg_list[0].text
+def JUMPIFEQ(ins):
+    _, _, order, target, src1, src2 = ins
+    symb1_v, symb1_t = resolve_symb(order, "JUMPIFEQ", src1)
+    symb2_v, symb2_t = resolve_symb(order, "JUMPIFEQ", src2)
     # --- COMPARATION
     if symb1_t == symb2_t: # same types
-        if symb1_t == "int":
-            if int(symb1_v) == int(symb2_v):
-                return int(labels[label])
-        if symb1_t == "bool":
-            if symb1_v == symb2_v:
-                return int(labels[label])
-        if symb1_t == "string":
-            if symb1_v == symb2_v:
-                return int(labels[label])
+        if symb1_t != None and symb1_v == symb2_v:
+            return target
     else:
-        sys.stderr.write("ERROR: JUMPIFEQ (order " + str(order) + ") has incompatible argument types '" + str(arg_list[1].text) + "' (" + str(symb1_t) + ") and '" + str(arg_list[2].text) + "' (" + str(symb2_t) + ")\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: JUMPIFEQ (order " + str(order) + ") has incompatible argument types '" + operand_text(src1) + "' (" + str(symb1_t) + ") and '" + operand_text(src2) + "' (" + str(symb2_t) + ")\n")
 # label, symb1, symb2
-def JUMPIFNEQ(order, arg_list):
-    global labels
-    symb1_v, symb1_t = resolve_parameter_symb(order, "JUMPIFEQ", arg_list[1])
-    symb2_v, symb2_t = resolve_parameter_symb(order, "JUMPIFEQ", arg_list[2])
-    # --- RESOLVE label
-    label = arg_list[0].text
+def JUMPIFNEQ(ins):
+    _, _, order, target, src1, src2 = ins
+    symb1_v, symb1_t = resolve_symb(order, "JUMPIFEQ", src1)
+    symb2_v, symb2_t = resolve_symb(order, "JUMPIFEQ", src2)
     # --- COMPARATION
     if symb1_t == symb2_t: # same types
-        if symb1_t == "int":
-            if int(symb1_v) != int(symb2_v):
-                return int(labels[label])
-        if symb1_t == "bool":
-            if symb1_v != symb2_v:
-                return int(labels[label])
-        if symb1_t == "string":
-            if symb1_v != symb2_v:
-                return int(labels[label])
+        if symb1_t != None and symb1_v != symb2_v:
+            return target
     else:
-        sys.stderr.write("ERROR: JUMPIFNEQ (order " + str(order) + ") has incompatible argument types '" + str(arg_list[1].text) + "' (" + str(symb1_t) + ") and '" + str(arg_list[2].text) + "' (" + str(symb2_t) + ")\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_OPERANDS'])
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: JUMPIFNEQ (order " + str(order) + ") has incompatible argument types '" + operand_text(src1) + "' (" + str(symb1_t) + ") and '" + operand_text(src2) + "' (" + str(symb2_t) + ")\n")
 # symb
-def DPRINT(order, arg_list):
+def DPRINT(ins):
     global tFrame, gFrame, lFrame
-    symb = arg_list[0]
-    var = False
-    if '@' in symb.text:
-        if (symb.text[:3] == 'LF@'):
-            if lFrame != None:
-                var = lFrame.find_var(symb.text[3:])
-            else:
-                sys.stderr.write("Frame for variable " + str(symb.text) + " not initialized.\n")
-        elif (symb.text[:3] == 'GF@'):
-            var = gFrame.find_var(symb.text[3:])
-        elif (symb.text[:3] == 'TF@'):
-            if tFrame != None:
-                var = tFrame.find_var(symb.text[3:])
-            else:
-                sys.stderr.write("Frame for variable " + str(symb.text) + " not initialized.\n")
-        if var == False:
-            sys.stderr.write("Variable " + str(symb.text) + " not found.\n")
-        elif var.value == None:
-            sys.stderr.write("Variable " + str(symb.text) + " not initialized.\n")
+    output.flush() # keeps order of stdout and stderr
+    symb = ins[3]
+    if symb[0] != None:
+        frame_name, slot, text = symb
+        frame = None
+        if frame_name == 'LF':
+            frame = lFrame
+        elif frame_name == 'GF':
+            frame = gFrame
+        elif frame_name == 'TF':
+            frame = tFrame
+        if frame == None:
+            error_output.write("Frame for variable " + str(text) + " not initialized.\n")
+        if frame == None or not frame.defined(slot):
+            error_output.write("Variable " + str(text) + " not found.\n")
+        elif frame.values[slot] == None:
+            error_output.write("Variable " + str(text) + " not initialized.\n")
         else:
-            sys.stderr.write(str(var.value) + "\n")
+            error_output.write(value_text(frame.values[slot], frame.types[slot]) + "\n")
     else:
-        sys.stderr.write(symb.text)
-#
-def BREAK(order, arg_list):
-    sys.stderr.write("-----------------------------------------------\n")
-    sys.stderr.write("| BREAK | Order (" + str(order) + ") | Instruction count (" + str(Instruction.processed) + ") |\n")
-    sys.stderr.write("-----------------------------------------------\n")
-    sys.stderr.write("$ GF as (NAME,VALUE,TYPE): \n")
-    for var in gFrame.table:
-        sys.stderr.write("-> ('" + str(var.name) + "','" + str(var.value) + "','" + str(var.var_type) + "')\n")
+        error_output.write(operand_text(symb))
+# state dump is printed by dispatch loop, which knows instruction count
+def BREAK(ins):
+    return TRAP_BREAK
+
+# limits of state summary - characters of value and values on top of data stack
+STATE_VALUE_WIDTH = 64
+STATE_STACK_SIZE = 16
+
+# returns value as text of at most STATE_VALUE_WIDTH characters
+def short_text(value, var_type):
+    text = value_text(value, var_type)
+    return text if len(text) <= STATE_VALUE_WIDTH else text[:STATE_VALUE_WIDTH] + "..."
+
+# prints interpret state to stderr (BREAK instruction, exceeded budget), summary shortens
+# long values and shows only top of data stack (state of exceeded budget may be huge)
+def print_state(order, title = "BREAK", summary = False):
+    text = short_text if summary else value_text
+    output.flush() # keeps order of stdout and stderr
+    error_output.write("-----------------------------------------------\n")
+    error_output.write("| " + title + " | Order (" + str(order) + ") | Instruction count (" + str(Instruction.processed) + ") |\n")
+    error_output.write("-----------------------------------------------\n")
+    error_output.write("$ GF as (NAME,VALUE,TYPE): \n")
+    for name, value, var_type in gFrame.variables():
+        error_output.write("-> ('" + str(name) + "','" + text(value, var_type) + "','" + str(var_type) + "')\n")
     try:
-        sys.stderr.write("$ LF as (NAME,VALUE,TYPE): \n")
-        for var in lFrame.table:
-            sys.stderr.write("-> ('" + str(var.name) + "','" + str(var.value) + "','" + str(var.var_type) + "')\n")
+        error_output.write("$ LF as (NAME,VALUE,TYPE): \n")
+        for name, value, var_type in lFrame.variables():
+            error_output.write("-> ('" + str(name) + "','" + text(value, var_type) + "','" + str(var_type) + "')\n")
     except NameError:
         ...
     except AttributeError:
         ...
     try:
-        sys.stderr.write("$ TF as (NAME,VALUE,TYPE): \n")
-        for var in tFrame.table:
-            sys.stderr.write("-> ('" + str(var.name) + "','" + str(var.value) + "','" + str(var.var_type) + "')\n")
+        error_output.write("$ TF as (NAME,VALUE,TYPE): \n")
+        for name, value, var_type in tFrame.variables():
+            error_output.write("-> ('" + str(name) + "','" + text(value, var_type) + "','" + str(var_type) + "')\n")
     except NameError:
         ...
     except AttributeError:
         ...
     try:
-        sys.stderr.write("$ DSTACK as (VALUE,TYPE): \n")
-        for var in dStack.data_arr:
-            sys.stderr.write("-> ('" + str(var.value) + "','" + str(var.var_type) + "')\n")
+        error_output.write("$ DSTACK as (VALUE,TYPE): \n")
+        first = len(dStack.values) - STATE_STACK_SIZE if summary and len(dStack.values) > STATE_STACK_SIZE else 0
+        if first:
+            error_output.write("-> ... " + str(first) + " values\n")
+        for value, var_type in zip(dStack.values[first:], dStack.types[first:]):
+            error_output.write("-> ('" + text(value, var_type) + "','" + str(var_type) + "')\n")
     except NameError:
         ...
     except AttributeError:
         ...
 
+# STACK INSTRUCTIONS
+"""
+Operands are taken from data stack (second operand on top) and result is pushed back, so they
+replace the first operand on top of the stack in place.
+"""
+# checks that data stack holds count operands of instruction, raises Error
+def stack_operands(order, f_name, count):
+    if len(dStack.values) < count:
+        runtime_error('RUNTIME_ERROR_VALUE', 'ERROR: ' + str(f_name) + ' (order ' + str(order) + ') reaches empty Stack\n')
+    return dStack.values, dStack.types
+#
+def CLEARS(ins):
+    dStack.values.clear()
+    dStack.types.clear()
+#
+def ADDS(ins):
+    values, types = stack_operands(ins[2], "ADDS", 2)
+    if types[-1] == "int" and types[-2] == "int":
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] + symb2_v
+    else:
+        operand_types_error(ins[2], "ADDS", types[-2], types[-1])
+#
+def SUBS(ins):
+    values, types = stack_operands(ins[2], "SUBS", 2)
+    if types[-1] == "int" and types[-2] == "int":
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] - symb2_v
+    else:
+        operand_types_error(ins[2], "SUBS", types[-2], types[-1])
+#
+def MULS(ins):
+    values, types = stack_operands(ins[2], "MULS", 2)
+    if types[-1] == "int" and types[-2] == "int":
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] * symb2_v
+    else:
+        operand_types_error(ins[2], "MULS", types[-2], types[-1])
+#
+def IDIVS(ins):
+    values, types = stack_operands(ins[2], "IDIVS", 2)
+    if types[-1] == "int" and types[-2] == "int":
+        if values[-1] == 0:
+            runtime_error('RUNTIME_ERROR_ZERO', "ERROR: IDIVS (order " + str(ins[2]) + ") Division by zero!\n")
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] // symb2_v
+    else:
+        operand_types_error(ins[2], "IDIVS", types[-2], types[-1])
+#
+def LTS(ins):
+    values, types = stack_operands(ins[2], "LTS", 2)
+    if types[-1] == types[-2] and types[-1] != None:
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] < symb2_v
+        types[-1] = "bool"
+    else:
+        operand_types_error(ins[2], "LTS", types[-2], types[-1])
+#
+def GTS(ins):
+    values, types = stack_operands(ins[2], "GTS", 2)
+    if types[-1] == types[-2] and types[-1] != None:
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] > symb2_v
+        types[-1] = "bool"
+    else:
+        operand_types_error(ins[2], "GTS", types[-2], types[-1])
+#
+def EQS(ins):
+    values, types = stack_operands(ins[2], "EQS", 2)
+    if types[-1] == types[-2] and types[-1] != None:
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] == symb2_v
+        types[-1] = "bool"
+    else:
+        operand_types_error(ins[2], "EQS", types[-2], types[-1])
+#
+def ANDS(ins):
+    values, types = stack_operands(ins[2], "ANDS", 2)
+    if types[-1] == "bool" and types[-2] == "bool":
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] and symb2_v
+    else:
+        operand_types_error(ins[2], "ANDS", types[-2], types[-1])
+#
+def ORS(ins):
+    values, types = stack_operands(ins[2], "ORS", 2)
+    if types[-1] == "bool" and types[-2] == "bool":
+        types.pop()
+        symb2_v = values.pop()
+        values[-1] = values[-1] or symb2_v
+    else:
+        operand_types_error(ins[2], "ORS", types[-2], types[-1])
+#
+def NOTS(ins):
+    values, types = stack_operands(ins[2], "NOTS", 1)
+    if types[-1] == "bool":
+        values[-1] = not values[-1]
+    else:
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: NOTS (order " + str(ins[2]) + ") has incompatible argument type '" + str(types[-1]) + "'\n")
+#
+def INT2CHARS(ins):
+    values, types = stack_operands(ins[2], "INT2CHARS", 1)
+    if types[-1] != "int":
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: INT2CHARS (order " + str(ins[2]) + ") argument is not integer type\n")
+    try:
+        values[-1] = chr(values[-1])
+        types[-1] = "string"
+    except ValueError:
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: INT2CHARS (order " + str(ins[2]) + ") argument - index out of range\n")
+#
+def STRI2INTS(ins):
+    values, types = stack_operands(ins[2], "STRI2INTS", 2)
+    if types[-2] != "string":
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: STRI2INTS (order " + str(ins[2]) + ") first argument is not string type\n")
+    if types[-1] != "int":
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: STRI2INTS (order " + str(ins[2]) + ") second argument is not integer type\n")
+    try:
+        char = ord(values[-2][values[-1]])
+    except IndexError:
+        runtime_error('RUNTIME_ERROR_STRING', "ERROR: STRI2INTS (order " + str(ins[2]) + ") second argument - index " + str(values[-1]) + " out of range\n")
+    types.pop()
+    values.pop()
+    values[-1] = char
+    types[-1] = "int"
+# label
+def JUMPIFEQS(ins):
+    values, types = stack_operands(ins[2], "JUMPIFEQS", 2)
+    if types[-1] != types[-2]:
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: JUMPIFEQS (order " + str(ins[2]) + ") has incompatible argument types (" + str(types[-2]) + ") and (" + str(types[-1]) + ")\n")
+    symb_t = types.pop()
+    types.pop()
+    symb2_v = values.pop()
+    if values.pop() == symb2_v and symb_t != None:
+        return ins[3]
+# label
+def JUMPIFNEQS(ins):
+    values, types = stack_operands(ins[2], "JUMPIFNEQS", 2)
+    if types[-1] != types[-2]:
+        runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: JUMPIFNEQS (order " + str(ins[2]) + ") has incompatible argument types (" + str(types[-2]) + ") and (" + str(types[-1]) + ")\n")
+    symb_t = types.pop()
+    types.pop()
+    symb2_v = values.pop()
+    if values.pop() != symb2_v and symb_t != None:
+        return ins[3]
+
+# SUPERINSTRUCTIONS
+"""
+Made by optimize() (--optimize) from common instruction sequences:
+    (handler, opcode, order, originals, next_index, operands...)
+- originals  -> linked tuples of fused instructions, executed by run_fused() in rare cases
+                (errors, uninitialized operands), so messages and exit codes stay the same
+- next_index -> index following the fused sequence
+"""
+
+# executes original instructions of superinstruction one by one
+def run_fused(ins):
+    for sub in ins[3]:
+        target = sub[0](sub)
+        if target is not None:
+            return target # only last instruction of sequence jumps
+    return ins[4]
+
+# LT var symb1 symb2 + JUMPIFEQ/JUMPIFNEQ label var bool (operands var, symb1, symb2, target, jump_when)
+def LT_JUMP(ins):
+    _, _, order, _, next_index, dst, src1, src2, target, jump_when = ins
+    frame = resolve_var(order, "LT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "LT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "LT", src2)
+    if symb1_t != symb2_t or symb1_t == None:
+        return run_fused(ins)
+    result = symb1_v < symb2_v
+    frame.modify(dst[1], result, "bool")
+    return target if result == jump_when else next_index
+# GT var symb1 symb2 + JUMPIFEQ/JUMPIFNEQ label var bool
+def GT_JUMP(ins):
+    _, _, order, _, next_index, dst, src1, src2, target, jump_when = ins
+    frame = resolve_var(order, "GT", dst)
+    symb1_v, symb1_t = resolve_symb(order, "GT", src1)
+    symb2_v, symb2_t = resolve_symb(order, "GT", src2)
+    if symb1_t != symb2_t or symb1_t == None:
+        return run_fused(ins)
+    result = symb1_v > symb2_v
+    frame.modify(dst[1], result, "bool")
+    return target if result == jump_when else next_index
+# EQ var symb1 symb2 + JUMPIFEQ/JUMPIFNEQ label var bool
+def EQ_JUMP(ins):
+    _, _, order, _, next_index, dst, src1, src2, target, jump_when = ins
+    frame = resolve_var(order, "EQ", dst)
+    symb1_v, symb1_t = resolve_symb(order, "EQ", src1)
+    symb2_v, symb2_t = resolve_symb(order, "EQ", src2)
+    if symb1_t != symb2_t or symb1_t == None:
+        return run_fused(ins)
+    result = symb1_v == symb2_v
+    frame.modify(dst[1], result, "bool")
+    return target if result == jump_when else next_index
+# DEFVAR var + MOVE var symb (operands var, symb)
+def DEFVAR_MOVE(ins):
+    _, _, _, originals, next_index, dst, src = ins
+    DEFVAR(originals[0])
+    s_val, s_type = resolve_symb(originals[1][2], "MOVE", src)
+    if s_val == None:
+        s_val = ""
+    look_up_frame(dst[0]).modify(dst[1], s_val, s_type)
+    return next_index
+# CREATEFRAME, PUSHFRAME, POPFRAME sequence, optionally followed by CALL
+def FRAME_SEQUENCE(ins):
+    for sub in ins[3]:
+        target = sub[0](sub)
+    return ins[4] if target is None else target
+# CONCAT var symb1 symb2 + CONCAT var var symb... (operands var, ((order, symb), ...))
+def CONCAT_CHAIN(ins):
+    _, _, order, _, next_index, dst, sources = ins
+    frame = resolve_var(order, "CONCAT", dst)
+    parts = []
+    for src_order, src in sources:
+        v, t = resolve_symb(src_order, "CONCAT", src)
+        if t != "string":
+            return run_fused(ins)
+        parts.append(v)
+    frame.modify(dst[1], "".join(parts), "string")
+    return next_index
+
+# SPECIALISED INSTRUCTIONS
+"""
+Made by specialize() (--specialize) for instructions whose operands are constants or variables
+of global frame proven by analyze_program() to be defined and of the right type, so they run
+without frame lookup and type checks. Layout is the same as of the original instruction.
+"""
+# var, symb1, symb2
+def ADD_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) + (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "int"
+# var, symb1, symb2
+def SUB_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) - (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "int"
+# var, symb1, symb2
+def MUL_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) * (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "int"
+# var, symb1, symb2 (division by zero is reported by IDIV)
+def IDIV_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    divisor = values[src2[1]] if src2[0] else src2[1]
+    if divisor == 0:
+        return IDIV(ins)
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) // divisor
+    gFrame.types[dst[1]] = "int"
+# var, symb1, symb2
+def LT_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) < (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb1, symb2
+def GT_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) > (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb1, symb2
+def EQ_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) == (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb1, symb2
+def AND_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) and (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb1, symb2
+def OR_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) or (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb
+def NOT_FAST(ins):
+    _, _, _, dst, src1 = ins
+    values = gFrame.values
+    values[dst[1]] = not (values[src1[1]] if src1[0] else src1[1])
+    gFrame.types[dst[1]] = "bool"
+# var, symb1, symb2
+def CONCAT_FAST(ins):
+    _, _, _, dst, src1, src2 = ins
+    values = gFrame.values
+    values[dst[1]] = (values[src1[1]] if src1[0] else src1[1]) + (values[src2[1]] if src2[0] else src2[1])
+    gFrame.types[dst[1]] = "string"
+# var, symb
+def MOVE_FAST(ins):
+    _, _, _, dst, src = ins
+    if src[0]:
+        gFrame.values[dst[1]] = gFrame.values[src[1]]
+        gFrame.types[dst[1]] = gFrame.types[src[1]]
+    else:
+        gFrame.values[dst[1]] = src[1]
+        gFrame.types[dst[1]] = src[2]
+# var
+def DEFVAR_FAST(ins):
+    gFrame.values[ins[3][1]] = None
+    gFrame.types[ins[3][1]] = None
+# symb
+def WRITE_FAST(ins):
+    src = ins[3]
+    value = gFrame.values[src[1]] if src[0] else src[1]
+    if value.__class__ is bool:
+        output.write("true\n" if value else "false\n")
+    else:
+        output.write(str(value) + "\n")
+# label, symb1, symb2
+def JUMPIFEQ_FAST(ins):
+    _, _, _, target, src1, src2 = ins
+    values = gFrame.values
+    if (values[src1[1]] if src1[0] else src1[1]) == (values[src2[1]] if src2[0] else src2[1]):
+        return target
+# label, symb1, symb2
+def JUMPIFNEQ_FAST(ins):
+    _, _, _, target, src1, src2 = ins
+    values = gFrame.values
+    if (values[src1[1]] if src1[0] else src1[1]) != (values[src2[1]] if src2[0] else src2[1]):
+        return target
+
 # class representing one instruction with parameter list, enables calling
 class Instruction:
     # list of valid instructions
@@ -751,7 +1280,22 @@ class Instruction:
         'JUMPIFEQ': JUMPIFEQ,
         'JUMPIFNEQ': JUMPIFNEQ,
         'DPRINT': DPRINT,
-        'BREAK': BREAK
+        'BREAK': BREAK,
+        'CLEARS': CLEARS,
+        'ADDS': ADDS,
+        'SUBS': SUBS,
+        'MULS': MULS,
+        'IDIVS': IDIVS,
+        'LTS': LTS,
+        'GTS': GTS,
+        'EQS': EQS,
+        'ANDS': ANDS,
+        'ORS': ORS,
+        'NOTS': NOTS,
+        'INT2CHARS': INT2CHARS,
+        'STRI2INTS': STRI2INTS,
+        'JUMPIFEQS': JUMPIFEQS,
+        'JUMPIFNEQS': JUMPIFNEQS
     }
 
     # list of instruction arguments
@@ -789,130 +1333,2217 @@ class Instruction:
         'JUMPIFEQ': 'lss',
         'JUMPIFNEQ': 'lss',
         'DPRINT': 's',
-        'BREAK': ''
+        'BREAK': '',
+        'CLEARS': '',
+        'ADDS': '',
+        'SUBS': '',
+        'MULS': '',
+        'IDIVS': '',
+        'LTS': '',
+        'GTS': '',
+        'EQS': '',
+        'ANDS': '',
+        'ORS': '',
+        'NOTS': '',
+        'INT2CHARS': '',
+        'STRI2INTS': '',
+        'JUMPIFEQS': 'l',
+        'JUMPIFNEQS': 'l'
+    }
+
+    # superinstructions made by optimize()
+    fused_list = {
+        'LT_JUMP': LT_JUMP,
+        'GT_JUMP': GT_JUMP,
+        'EQ_JUMP': EQ_JUMP,
+        'DEFVAR_MOVE': DEFVAR_MOVE,
+        'FRAME_SEQUENCE': FRAME_SEQUENCE,
+        'CONCAT_CHAIN': CONCAT_CHAIN
+    }
+
+    # variants of instructions with proven operands made by specialize()
+    fast_list = {
+        'ADD_FAST': ADD_FAST,
+        'SUB_FAST': SUB_FAST,
+        'MUL_FAST': MUL_FAST,
+        'IDIV_FAST': IDIV_FAST,
+        'LT_FAST': LT_FAST,
+        'GT_FAST': GT_FAST,
+        'EQ_FAST': EQ_FAST,
+        'AND_FAST': AND_FAST,
+        'OR_FAST': OR_FAST,
+        'NOT_FAST': NOT_FAST,
+        'CONCAT_FAST': CONCAT_FAST,
+        'MOVE_FAST': MOVE_FAST,
+        'DEFVAR_FAST': DEFVAR_FAST,
+        'WRITE_FAST': WRITE_FAST,
+        'JUMPIFEQ_FAST': JUMPIFEQ_FAST,
+        'JUMPIFNEQ_FAST': JUMPIFNEQ_FAST
     }
 
+    # all handlers by name
+    handlers = dict(inst_list, **fused_list, **fast_list)
+
+    # integer operation codes used in compiled program
+    opcodes = {name: code for code, name in enumerate(handlers)}
+
     processed = 0
 
+    __slots__ = ('order', 'name', 'parameter_list')
+
     def __init__(self, order, name, parameter_list):
         self.order = order
         self.name = name
         self.parameter_list = parameter_list
 
-    def call(self):
-        Instruction.processed += 1
-        inst_func = Instruction.inst_list[self.name]
-        r_val = inst_func(self.order, self.parameter_list)
-        if is_int(r_val):
-            return int(r_val)
+# error found while loading XML source, main() reports it and exits with EXIT_CODES[code]
+class LoadError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+        self.order = None # order attribute of failed instruction, when its lower bound was checked
 
 # checks number of attributes in element tag
 def check_attributes(tag, attr_list_given, attr_list_req):
     if len(attr_list_given) > len(attr_list_req):
-        sys.stderr.write("ERROR: Invalid XML file - too many arguments in '" + str(tag) + "' element tag\n")
-        sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
+        raise LoadError('BAD_XML_FORMAT', "ERROR: Invalid XML file - too many arguments in '" + str(tag) + "' element tag\n")
     else:
         for attr in attr_list_given:
             if attr not in attr_list_req:
-                sys.stderr.write("ERROR: Invalid XML file - attribute '" + str(attr) + "' in '" + str(tag) + "' not supported\n")
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
+                raise LoadError('BAD_XML_FORMAT', "ERROR: Invalid XML file - attribute '" + str(attr) + "' in '" + str(tag) + "' not supported\n")
 
-# looking for variable in all frames, raises error if frame not allocated, false if variable not found
-def look_up_variable(name: str):
-    global lFrame, gFrame, tFrame
-    if name[:3] == "LF@":
+# looking for frame of variable, raises error if frame not allocated
+def look_up_frame(frame):
+    if frame == 'GF':
+        return gFrame
+    if frame == 'LF':
         if lFrame != None:
-            var = lFrame.find_var(name[3:])
-        else:
-            sys.stderr.write('ERROR: Nonallocated Local Stack\n')
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME'])
-    if name[:3] == "GF@":
-        var = gFrame.find_var(name[3:])
-    if name[:3] == "TF@":
-        if tFrame != None:
-            var = tFrame.find_var(name[3:])
+            return lFrame
+        runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: Nonallocated Local Stack\n')
+    if tFrame != None:
+        return tFrame
+    runtime_error('RUNTIME_ERROR_FRAME', 'ERROR: Nonallocated Temporary Stack\n')
+
+# resolves compiled var operand to its Frame, if variable not defined, raises Error
+def resolve_var(order, f_name, operand):
+    frame = look_up_frame(operand[0])
+    if frame.types[operand[1]] is UNDEFINED:
+        runtime_error('RUNTIME_ERROR_VARIABLE', "ERROR: " + str(f_name) + " (order " + str(order) + ") reaches uninitialized variable '" + str(operand[2]) + "'\n")
+    return frame
+
+# resolves compiled symb operand to (value, type), if variable not defined, raises Error
+def resolve_symb(order, f_name, operand):
+    if operand[0] == None: # constant
+        return operand[1], operand[2]
+    frame = resolve_var(order, f_name, operand)
+    value = frame.values[operand[1]]
+    if value.__class__ is MutableString:
+        return str(value), "string"
+    return value, frame.types[operand[1]]
+
+# resolves symb operand as resolve_symb, but string value may stay MutableString (indexing and length only)
+def resolve_chars(order, f_name, operand):
+    if operand[0] == None: # constant
+        return operand[1], operand[2]
+    frame = resolve_var(order, f_name, operand)
+    return frame.values[operand[1]], frame.types[operand[1]]
+
+# flushes program output, prints error message and exits with EXIT_CODES[code]
+def runtime_error(code, message):
+    output.flush()
+    error_output.write(message)
+    sys.exit(EXIT_CODES[code])
+
+# raises Error for binary operation with unsupported operand types
+def operand_types_error(order, f_name, type1, type2):
+    runtime_error('RUNTIME_ERROR_OPERANDS', "ERROR: " + str(f_name) + " (order " + str(order) + ") has incompatible argument types '" + str(type1) + "' and '" + str(type2) + "'\n")
+
+# escape sequence \ddd or entity &gt; &lt; &amp; in string literal (lone backslash is an error)
+STRING_ESCAPE = re.compile(r'\\([0-9]{3})?|&(gt|lt|amp);')
+STRING_ENTITIES = {'gt': '>', 'lt': '<', 'amp': '&'}
+STRING_WHITESPACE = re.compile(r'\s')
+
+def decode_escape(match):
+    if match.group(2) != None:
+        return STRING_ENTITIES[match.group(2)]
+    if match.group(1) == None:
+        raise LoadError('LEXYCAL_OR_SYNTACTIC_ERROR', "ERROR: Incompatible string format in XML file\n")
+    return chr(int(match.group(1)))
+
+# checks string for nonallowed chars and decodes escape sequences, return string or raises Error,
+# strings are decoded literals of loaded program - each distinct literal is decoded once and shared
+def correct_string(s, strings):
+    if s == None:
+        return ""
+    decoded = strings.get(s)
+    if decoded == None:
+        if STRING_WHITESPACE.search(s):
+            raise LoadError('LEXYCAL_OR_SYNTACTIC_ERROR', "ERROR: Incompatible string format in XML file\n")
+        decoded = STRING_ESCAPE.sub(decode_escape, s) if '\\' in s or '&' in s else s
+        strings[s] = decoded
+    return decoded
+
+# compiled program as parallel arrays, contains only plain data, so it can be stored by marshal:
+#   opcodes       - opcode of each instruction (array of bytes)
+#   operands      - OPERANDS indexes to operand_table for each instruction, -1 when unused
+#   operand_table - distinct compiled operands, equal operands are shared - variable (frame, slot,
+#                   text), constant (None, value, type), label (index of following instruction), type
+#   texts         - texts of constants which differ from value_text() of their value (int@+1)
+#   label_names, label_indexes - label name and index of its LABEL instruction
+#   orders        - order attributes which are not index + 1 (leading zeros), mostly empty
+# Instruction tuples of COMPILED INSTRUCTIONS are built only when program is linked.
+class Program:
+    OPERANDS = 3
+
+    def __init__(self, opcodes, operands, operand_table, texts, global_names, local_names, label_names, label_indexes, orders, python = None):
+        self.opcodes = opcodes
+        self.operands = operands
+        self.operand_table = operand_table
+        self.texts = texts
+        self.global_names = global_names # slots of GF
+        self.local_names = local_names # slots of LF and TF
+        self.label_names = label_names
+        self.label_indexes = label_indexes
+        self.orders = orders
+        self.python = python # code object of translated program (--engine=python), False if not translatable
+        self.label_at = None # target index -> label name, made by instruction()
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    # order attribute of instruction on given index
+    def order(self, index):
+        return self.orders.get(index) or str(index + 1)
+
+    # label name -> order
+    @property
+    def labels(self):
+        return {name: self.order(index) for name, index in zip(self.label_names, self.label_indexes)}
+
+    # text of constant on given index of operand table
+    def text(self, operand):
+        text = self.texts.get(operand)
+        if text == None:
+            constant = self.operand_table[operand]
+            text = value_text(constant[1], constant[2])
+        return text
+
+    # builds instruction tuples (opcode, order, operands...), CALL has also return index,
+    # operands are shared with operand table
+    def instructions(self):
+        arity = [len(Instruction.inst_args.get(name, '')) for name in Instruction.opcodes]
+        call = Instruction.opcodes['CALL']
+        table = list(self.operand_table)
+        for index, text in self.texts.items():
+            table[index] += (text,) # constants written differently keep their text
+        operands = self.operands
+        code = []
+        for index, opcode in enumerate(self.opcodes):
+            start = index * self.OPERANDS
+            ins = (opcode, self.order(index)) + tuple([table[operand] for operand in operands[start:start + arity[opcode]]])
+            if opcode == call:
+                ins += (index + 1,) # return index
+            code.append(ins)
+        return code
+
+    # returns Instruction with Parameters of instruction on given index (debugging)
+    def instruction(self, index):
+        if self.label_at == None:
+            self.label_at = {label_index + 1: label for label, label_index in zip(self.label_names, self.label_indexes)}
+        name = list(Instruction.opcodes)[self.opcodes[index]]
+        parameter_list = []
+        start = index * self.OPERANDS
+        for position, kind in enumerate(Instruction.inst_args[name]):
+            operand = self.operand_table[self.operands[start + position]]
+            tag = 'arg' + str(position + 1)
+            if kind == 'l':
+                parameter_list.append(Parameter(tag, self.label_at[operand], 'label'))
+            elif kind == 't':
+                parameter_list.append(Parameter(tag, operand, 'type'))
+            elif operand[0] == None:
+                parameter_list.append(Parameter(tag, self.text(self.operands[start + position]), operand[2]))
+            else:
+                parameter_list.append(Parameter(tag, operand[2], 'var'))
+        return Instruction(self.order(index), name, parameter_list)
+
+# lowers argument (key of ProgramBuilder.interned) to operand of Program
+def compile_operand(key, labels, global_symbols, local_symbols):
+    par_type, text = key
+    if par_type == 'l':
+        return int(labels[text])
+    if par_type == 't':
+        return text
+    if par_type == "var":
+        symbols = global_symbols if text[:2] == 'GF' else local_symbols # TF becomes LF after PUSHFRAME
+        return (text[:2], symbols.slot(text[3:]), text)
+    return (None, literal_value(text, par_type), par_type)
+
+# compiles validated instructions to Program while they are read, so no list of instructions is
+# kept - instructions may come in any order of their order attributes, finish() sorts them,
+# checks orders and jumps and resolves operands
+class ProgramBuilder:
+    ORDER_LIMIT = 1 << 62 # stored instead of bigger order (always invalid)
+
+    def __init__(self):
+        self.opcodes = array.array('B')
+        self.operands = array.array('i')
+        self.order_numbers = array.array('q') # order of each added instruction
+        self.order_texts = {} # added index -> order attribute which is not plain number
+        self.operand_table = [] # keys of interned until finish()
+        self.interned = {} # (type, text) of argument, (kind, text) of label and type -> index to operand_table
+        self.labels = {} # label name -> order
+
+    # adds validated Instruction, raises LoadError for label redefinition
+    def add(self, instruction):
+        number = int(instruction.order)
+        if str(number) != instruction.order or number > ProgramBuilder.ORDER_LIMIT:
+            self.order_texts[len(self.opcodes)] = instruction.order
+        self.order_numbers.append(min(number, ProgramBuilder.ORDER_LIMIT))
+        self.opcodes.append(Instruction.opcodes[instruction.name])
+        operands = [-1] * Program.OPERANDS
+        for position, (param, kind) in enumerate(zip(instruction.parameter_list, Instruction.inst_args[instruction.name])):
+            key = (kind, param.text) if kind in ('l', 't') else (param.par_type, param.text)
+            operand = self.interned.get(key)
+            if operand == None:
+                operand = self.interned[key] = len(self.operand_table)
+                self.operand_table.append(key)
+            operands[position] = operand
+        self.operands.extend(operands)
+        if instruction.name == "LABEL": # save label for jumps
+            label = instruction.parameter_list[0].text
+            if label in self.labels:
+                error = LoadError('SEMANTIC_ERROR', "ERROR: Label '" + str(label) + "' redefinition at instruction order " + str(instruction.order) + "\n")
+                error.order = instruction.order
+                raise error
+            self.labels[label] = instruction.order
+
+    # order attribute of instruction added as index-th
+    def order_text(self, index):
+        return self.order_texts.get(index) or str(self.order_numbers[index])
+
+    # checks orders of added instructions (program has xml_len instructions), raises first validation
+    # error, checks jumps, returns Program
+    def finish(self, xml_len, error = None, xml_file = None):
+        # order in interval, instructions before first error are added, order of failed
+        # instruction is checked before its error
+        for index, number in enumerate(self.order_numbers):
+            if number > xml_len:
+                raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid instruction order: ' + self.order_text(index) + "\n")
+        if error != None:
+            if error.order != None and int(error.order) > xml_len:
+                raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid instruction order: ' + str(error.order) + "\n")
+            raise error
+
+        # instructions sorted by order
+        added = [None] * xml_len # index of instruction -> added index
+        for index, number in enumerate(self.order_numbers):
+            added[number - 1] = index # later instruction with the same order replaces former
+        if None in added:
+            raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file: ' + str(xml_file) + ' - order attributes incorrect\n')
+        opcodes, operands = self.opcodes, self.operands
+        if added != list(range(xml_len)):
+            opcodes = array.array('B', [self.opcodes[index] for index in added])
+            operands = array.array('i')
+            for index in added:
+                operands.extend(self.operands[index * Program.OPERANDS:(index + 1) * Program.OPERANDS])
+        orders = {self.order_numbers[index] - 1: text for index, text in self.order_texts.items()}
+
+        # every jump leads to existing label
+        table = self.operand_table
+        missing = {operand for key, operand in self.interned.items() if key[0] == 'l' and key[1] not in self.labels}
+        if missing:
+            jumps = {Instruction.opcodes[name] for name in ("CALL", "JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS")}
+            for index, opcode in enumerate(opcodes):
+                operand = operands[index * Program.OPERANDS]
+                if opcode in jumps and operand in missing:
+                    raise LoadError('SEMANTIC_ERROR', "ERROR: : Nonexistent label'" + str(table[operand][1]) + "in instruction at order '" + str(orders.get(index) or index + 1) + "'\n")
+
+        # operands in order of first use, so variable slots are assigned in program order
+        global_symbols = SymbolTable()
+        local_symbols = SymbolTable()
+        texts = {}
+        resolved = bytearray(len(table))
+        remaining = len(table)
+        for operand in operands:
+            if remaining == 0:
+                break
+            if operand < 0 or resolved[operand]:
+                continue
+            resolved[operand] = 1
+            remaining -= 1
+            key = table[operand]
+            compiled = table[operand] = compile_operand(key, self.labels, global_symbols, local_symbols)
+            if compiled.__class__ is tuple and compiled[0] == None and key[1] != value_text(compiled[1], compiled[2]):
+                texts[operand] = key[1] # constant is written by DPRINT and error messages as in source
+        label_names = list(self.labels)
+        label_indexes = array.array('i', [int(self.labels[name]) - 1 for name in label_names])
+        return Program(opcodes, operands, table, texts, global_symbols.names, local_symbols.names, label_names, label_indexes, orders)
+
+# prepares Program to run - sets symbol tables and adds handler to each instruction
+def link_program(program):
+    global gSymbols, lSymbols
+    gSymbols = SymbolTable(program.global_names)
+    lSymbols = SymbolTable(program.local_names)
+    handlers = [Instruction.handlers[name] for name in Instruction.opcodes]
+    return [(handlers[ins[0]],) + ins for ins in program.instructions()]
+
+# starts new run of linked program - fresh frames, stacks and program streams,
+# output_stream and input_stream are binary, natively sys.stdout.buffer and sys.stdin.buffer
+def init_run(output_stream = None, input_stream = None, error_stream = None):
+    global gFrame, lFrame, tFrame, fStack, cStack, dStack, output, program_input, error_output, frame_pool, budget
+    gFrame = GlobalFrame(gSymbols)
+    lFrame = None
+    tFrame = None
+    fStack = FrameStack()
+    cStack = CallStack()
+    frame_pool = FramePool(lSymbols)
+    dStack = DataStack()
+    output = Output(output_stream)
+    program_input = Input(input_stream)
+    error_output = sys.stderr if error_stream == None else error_stream
+    budget = Budget()
+    Instruction.processed = 0
+
+# peephole optimizer (--optimize), replaces common sequences of linked instructions with
+# superinstructions. Fused instructions keep their places (jump targets stay valid) and are
+# skipped by the superinstruction, sequence is fused only when no jump or return leads inside.
+# Programs with BREAK are not optimized, so BREAK always reports exact instruction count.
+def optimize(code):
+    ops = Instruction.opcodes
+    handlers = Instruction.handlers
+    if any(ins[1] == ops['BREAK'] for ins in code):
+        return code
+
+    # indexes where execution may continue after jump or return
+    targets = set()
+    for index, ins in enumerate(code):
+        if ins[1] in (ops['JUMP'], ops['JUMPIFEQ'], ops['JUMPIFNEQ'], ops['JUMPIFEQS'], ops['JUMPIFNEQS'], ops['CALL']):
+            targets.add(ins[3])
+        if ins[1] == ops['CALL']:
+            targets.add(index + 1)
+
+    compare_jumps = {ops['LT']: 'LT_JUMP', ops['GT']: 'GT_JUMP', ops['EQ']: 'EQ_JUMP'}
+    frame_ops = (ops['CREATEFRAME'], ops['PUSHFRAME'], ops['POPFRAME'])
+    same_var = lambda a, b: a[0] != None and b[0] != None and a[:2] == b[:2]
+
+    optimized = list(code)
+    i = 0
+    while i < len(code) - 1:
+        ins = code[i]
+        op = ins[1]
+        nxt = code[i + 1]
+        fused = None
+        end = i + 1 # index after fused sequence
+
+        if i + 1 in targets:
+            ...
+        # LT/GT/EQ var symb symb + JUMPIFEQ/JUMPIFNEQ label var bool@x
+        elif op in compare_jumps and nxt[1] in (ops['JUMPIFEQ'], ops['JUMPIFNEQ']):
+            dst = ins[3]
+            s1, s2 = nxt[4], nxt[5]
+            if same_var(s1, dst) and s2[0] == None and s2[2] == "bool":
+                const = s2[1]
+            elif same_var(s2, dst) and s1[0] == None and s1[2] == "bool":
+                const = s1[1]
+            else:
+                const = None
+            if const != None:
+                jump_when = const if nxt[1] == ops['JUMPIFEQ'] else not const
+                end = i + 2
+                name = compare_jumps[op]
+                fused = (handlers[name], ops[name], ins[2], (ins, nxt), end, dst, ins[4], ins[5], nxt[3], jump_when)
+        # DEFVAR var + MOVE var symb
+        elif op == ops['DEFVAR'] and nxt[1] == ops['MOVE'] and same_var(ins[3], nxt[3]):
+            end = i + 2
+            fused = (handlers['DEFVAR_MOVE'], ops['DEFVAR_MOVE'], ins[2], (ins, nxt), end, nxt[3], nxt[4])
+        # CREATEFRAME/PUSHFRAME/POPFRAME... [CALL]
+        elif op in frame_ops and (nxt[1] in frame_ops or nxt[1] == ops['CALL']):
+            while end < len(code) and end not in targets and code[end][1] in frame_ops:
+                end += 1
+            if end < len(code) and end not in targets and code[end][1] == ops['CALL']:
+                end += 1
+            fused = (handlers['FRAME_SEQUENCE'], ops['FRAME_SEQUENCE'], ins[2], tuple(code[i:end]), end)
+        # CONCAT var symb symb + CONCAT var var symb...
+        elif op == ops['CONCAT']:
+            dst = ins[3]
+            sources = [(ins[2], ins[4]), (ins[2], ins[5])]
+            while end < len(code) and end not in targets and code[end][1] == ops['CONCAT'] \
+                    and same_var(code[end][3], dst) and same_var(code[end][4], dst) and not same_var(code[end][5], dst):
+                sources.append((code[end][2], code[end][5]))
+                end += 1
+            if end > i + 1:
+                fused = (handlers['CONCAT_CHAIN'], ops['CONCAT_CHAIN'], ins[2], tuple(code[i:end]), end, dst, tuple(sources))
+
+        if fused != None:
+            optimized[i] = fused
+            i = end
         else:
-            sys.stderr.write('ERROR: Nonallocated Temporary Stack\n')
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_FRAME'])
-    return var # Variable Instance or False
-
-# resolves given variable in parameter, if not found, raises Error
-def resolve_parameter_var(order, f_name, param):
-    var = look_up_variable(param.text)
-    if var == False:
-        sys.stderr.write("ERROR: " + str(f_name) + " (order " + str(order) + ") reaches uninitialized variable '" + str(param.text) + "'\n")
-        sys.exit(EXIT_CODES['RUNTIME_ERROR_VARIABLE'])
-
-    return var
-
-# resolves given symbol in parameter, if not found, raises Error
-def resolve_parameter_symb(order, f_name, param):
-    if param.par_type == "var":
-        var = look_up_variable(param.text)
-        if var == False:
-            sys.stderr.write("ERROR: " + str(f_name) + " (order " + str(order) + ") reaches uninitialized variable '" + str(param.text) + "'\n")
-            sys.exit(EXIT_CODES['RUNTIME_ERROR_VARIABLE'])
+            i += 1
+    return optimized
+
+# dispatch loop - runs compiled program from its first instruction
+def execute(code):
+    if budget.active():
+        execute_budgeted(code)
+        return
+    pc = 0
+    end = len(code)
+    steps = 0
+    try:
+        while pc < end:
+            ins = code[pc]
+            steps += 1
+            target = ins[0](ins)
+            if target is None:
+                pc += 1
+            elif target >= 0:
+                pc = target
+            else: # TRAP_BREAK
+                Instruction.processed = steps
+                print_state(ins[2])
+                pc += 1
+    finally:
+        Instruction.processed = steps
+        output.flush()
+
+# ------ BUDGETS AND CHECKPOINTS -------
+"""
+Limits of one run (--max-steps, --max-time, --max-memory). Dispatch loops with any limit set run
+instructions in chunks of at most CHECK_INTERVAL steps and call check() between chunks, so the
+step limit is exact and time is checked every CHECK_INTERVAL steps. Memory is estimated from
+values in frames and on data stack. One instruction may double the largest value, so the chunk
+ends after as many steps as doublings of the largest value fit to the rest of the limit, memory
+exceeds the limit at most by the last instruction. Exceeded limit prints state like BREAK and
+ends with its own exit code.
+The same chunks are used for checkpoints (--checkpoint-every) and for continuation of run
+from checkpoint (--resume), see Checkpoint.
+"""
+class Budget:
+    CHECK_INTERVAL = 1000
+
+    def __init__(self, max_steps = None, max_time = None, max_memory = None):
+        self.max_steps = max_steps # instructions
+        self.max_time = max_time # seconds
+        self.max_memory = max_memory # bytes
+        self.start = time.perf_counter()
+        self.memory_step = 0 # step of next memory estimate
+        self.checkpoint = None # Checkpoint written during run
+        self.checkpoint_step = 0 # step of next checkpoint
+        self.resume = None # (pc, steps) of restored checkpoint
+
+    # checks if any limit, checkpoint or resume is set, returns True x False
+    def active(self):
+        return self.max_steps != None or self.max_time != None or self.max_memory != None \
+            or self.checkpoint != None or self.resume != None
+
+    # starts measuring time of run, returns (pc, steps) where dispatch loop starts
+    def begin(self):
+        pc, steps = self.resume or (0, 0)
+        self.start = time.perf_counter()
+        self.memory_step = steps
+        if self.checkpoint != None:
+            self.checkpoint_step = steps + self.checkpoint.every
+        return pc, steps
+
+    # returns step count where next check() has to be made
+    def next_check(self, steps):
+        stop = steps + Budget.CHECK_INTERVAL
+        if self.max_steps != None:
+            stop = min(stop, self.max_steps)
+        if self.checkpoint != None:
+            stop = min(stop, self.checkpoint_step)
+        if self.max_memory != None:
+            stop = min(stop, self.memory_step)
+        return stop
+
+    # checks limits before instruction on index pc (given order), ends run when a limit is
+    # exceeded, writes checkpoint when it is time
+    def check(self, steps, pc, order):
+        if self.max_steps != None and steps >= self.max_steps:
+            self.exceeded(steps, order, "STEPS LIMIT", 'RUNTIME_ERROR_STEPS_LIMIT', 'ERROR: Step limit ' + str(self.max_steps) + ' exceeded\n')
+        if self.max_time != None and time.perf_counter() - self.start > self.max_time:
+            self.exceeded(steps, order, "TIME LIMIT", 'RUNTIME_ERROR_TIME_LIMIT', 'ERROR: Time limit ' + str(self.max_time) + ' s exceeded\n')
+        if self.max_memory != None and steps >= self.memory_step:
+            memory, largest = memory_usage()
+            if memory > self.max_memory:
+                self.exceeded(steps, order, "MEMORY LIMIT", 'RUNTIME_ERROR_MEMORY_LIMIT', 'ERROR: Memory limit ' + str(self.max_memory) + ' B exceeded (' + str(memory) + ' B)\n')
+            # one instruction may double the largest value (CONCAT, MUL), so next estimate is made
+            # before doubled values can outgrow the limit
+            headroom = (self.max_memory - memory) // max(largest, 1)
+            self.memory_step = steps + max(1, min(Budget.CHECK_INTERVAL, headroom.bit_length() - 3))
+        if self.checkpoint != None and steps >= self.checkpoint_step:
+            self.checkpoint.save(pc, steps)
+            self.checkpoint_step = steps + self.checkpoint.every
+
+    def exceeded(self, steps, order, title, code, message):
+        Instruction.processed = steps
+        print_state(order, title, summary = True)
+        runtime_error(code, message)
+
+# budget of current run, limits are set after init_run
+budget = Budget()
+
+# returns approximate size of one value in bytes
+def value_size(value):
+    if isinstance(value, MutableString):
+        return sys.getsizeof(value.chars) + sys.getsizeof(value.text)
+    return sys.getsizeof(value)
+
+# returns (approximate bytes, bytes of the largest value) held by frames and data stack
+def memory_usage():
+    frames = [gFrame] + fStack.frame_arr
+    if tFrame != None:
+        frames.append(tFrame)
+    size = sys.getsizeof(dStack.values) + sys.getsizeof(dStack.types) + sys.getsizeof(cStack.call_arr)
+    largest = 0
+    for frame in frames:
+        size += sys.getsizeof(frame.values) + sys.getsizeof(frame.types)
+        for value in frame.values:
+            if value is not None:
+                value_bytes = value_size(value)
+                size += value_bytes
+                largest = max(largest, value_bytes)
+    for value in dStack.values:
+        value_bytes = value_size(value)
+        size += value_bytes
+        largest = max(largest, value_bytes)
+    return size, largest
+
+"""
+Checkpoint is marshal dump of whole run state - index of next instruction, step count, GF, frame
+stack (LF), TF, call stack, data stack and position in input - with hash of program, so it is not
+restored for another program. State is copied and dumped between chunks of instructions, file is
+written by background thread to temporary file and renamed, so checkpoint file is always complete.
+Output is flushed before each checkpoint, output written after the last checkpoint is written
+again when run continues from it.
+"""
+CHECKPOINT_VERSION = 1
+
+# returns hash of compiled program (engine independent)
+def program_hash(program):
+    return hashlib.sha256(marshal.dumps((program.opcodes.tobytes(), program.operands.tobytes(), program.operand_table,
+                                         program.texts, program.global_names, program.local_names, program.orders))).hexdigest()
+
+# returns values of frame or stack as plain data (marshal)
+def plain_values(values):
+    return [str(value) if isinstance(value, MutableString) else value for value in values]
+
+class Checkpoint:
+    def __init__(self, path, every, program):
+        self.path = path
+        self.every = every # steps between checkpoints
+        self.program = program_hash(program)
+        self.writer = None # thread writing last checkpoint
+
+    # dumps current state and writes it in background
+    def save(self, pc, steps):
+        output.flush()
+        frames = [(plain_values(frame.values), list(frame.types)) for frame in fStack.frame_arr]
+        temporary = (plain_values(tFrame.values), list(tFrame.types)) if tFrame != None else None
+        data = marshal.dumps((CHECKPOINT_VERSION, self.program, pc, steps, plain_values(gFrame.values), list(gFrame.types),
+                              frames, temporary, list(cStack.call_arr), plain_values(dStack.values), list(dStack.types),
+                              program_input.position()))
+        self.wait()
+        self.writer = threading.Thread(target = self.write, args = (data,))
+        self.writer.start()
+
+    def write(self, data):
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            error_output.write('ERROR: Checkpoint cannot be written: ' + str(self.path) + "\n")
+
+    # waits until last checkpoint is written
+    def wait(self):
+        if self.writer != None:
+            self.writer.join()
+            self.writer = None
+
+# restores run state from checkpoint file (after init_run), raises LoadError
+def restore_checkpoint(path, program):
+    global lFrame, tFrame
+    try:
+        with open(path, 'rb') as f:
+            state = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: Checkpoint cannot be read: ' + str(path) + "\n")
+    if not isinstance(state, tuple) or len(state) != 12 or state[0] != CHECKPOINT_VERSION:
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: Invalid checkpoint: ' + str(path) + "\n")
+    if state[1] != program_hash(program):
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: Checkpoint belongs to another program: ' + str(path) + "\n")
+    _, _, pc, steps, g_values, g_types, frames, temporary, calls, d_values, d_types, position = state
+    gFrame.values[:] = g_values
+    gFrame.types[:] = g_types
+    for values, types in frames:
+        frame = Frame(lSymbols)
+        frame.values[:] = values
+        frame.types[:] = types
+        fStack.push(frame)
+    lFrame = fStack.get_lFrame()
+    if temporary != None:
+        tFrame = Frame(lSymbols)
+        tFrame.values[:] = temporary[0]
+        tFrame.types[:] = temporary[1]
+    cStack.call_arr[:] = calls
+    dStack.values[:] = d_values
+    dStack.types[:] = d_types
+    program_input.skip(position)
+    Instruction.processed = steps
+    budget.resume = (pc, steps)
+
+# dispatch loop of execute() with budget checks between chunks of instructions
+def execute_budgeted(code):
+    end = len(code)
+    pc, steps = budget.begin()
+    try:
+        while pc < end:
+            stop = budget.next_check(steps)
+            while pc < end and steps < stop:
+                ins = code[pc]
+                steps += 1
+                target = ins[0](ins)
+                if target is None:
+                    pc += 1
+                elif target >= 0:
+                    pc = target
+                else: # TRAP_BREAK
+                    Instruction.processed = steps
+                    print_state(ins[2])
+                    pc += 1
+            if pc < end:
+                budget.check(steps, pc, code[pc][2])
+    finally:
+        Instruction.processed = steps
+        output.flush()
+
+# ------ CLOSURE ENGINE -------
+"""
+Engine selected by --engine=closure. Each linked instruction is turned to closure without
+arguments which returns index of next instruction, so dispatch loop is only pc = code[pc]().
+Operands are bound when closure is made - constants as values, variables as readers of their
+frame slot. Closure handles only the common case, anything else (undefined variable, missing
+frame, wrong types, BREAK) raises Fallback before state is changed and the instruction is run
+once more by its handler, which reports error with the same message and exit code.
+"""
+class Fallback(Exception):
+    pass
+
+# returns accessor of var operand, accessor returns Frame with the variable defined or raises Fallback
+def frame_accessor(operand):
+    frame_name, slot = operand[0], operand[1]
+    if frame_name == 'GF':
+        frame = gFrame
+        types = frame.types
+        def access():
+            if types[slot] is UNDEFINED:
+                raise Fallback
+            return frame
+    elif frame_name == 'LF':
+        def access():
+            frame = lFrame
+            if frame is None or frame.types[slot] is UNDEFINED:
+                raise Fallback
+            return frame
+    else:
+        def access():
+            frame = tFrame
+            if frame is None or frame.types[slot] is UNDEFINED:
+                raise Fallback
+            return frame
+    return access
+
+# returns reader of symb operand, reader returns (value, type) as resolve_symb or raises Fallback
+def symb_reader(operand):
+    if operand[0] == None:
+        constant = (operand[1], operand[2])
+        return lambda: constant
+    slot = operand[1]
+    if operand[0] == 'GF':
+        values, types = gFrame.values, gFrame.types
+        def read():
+            var_type = types[slot]
+            if var_type is UNDEFINED:
+                raise Fallback
+            value = values[slot]
+            if value.__class__ is MutableString:
+                return str(value), var_type
+            return value, var_type
+        return read
+    access = frame_accessor(operand)
+    def read():
+        frame = access()
+        value = frame.values[slot]
+        if value.__class__ is MutableString:
+            return str(value), "string"
+        return value, frame.types[slot]
+    return read
+
+# instruction without own closure - runs its handler
+def closure_handler(ins, nxt):
+    handler = ins[0]
+    def run():
+        target = handler(ins)
+        return nxt if target is None else target
+    return run
+
+# var, symb1, symb2 - operation(v1, v2) of two operand_type values (None for any same types)
+def closure_binary(ins, nxt, operation, operand_type, result_type):
+    dst, slot = frame_accessor(ins[3]), ins[3][1]
+    read1, read2 = symb_reader(ins[4]), symb_reader(ins[5])
+    if operand_type != None:
+        def run():
+            frame = dst()
+            v1, t1 = read1()
+            v2, t2 = read2()
+            if t1 != operand_type or t2 != operand_type:
+                raise Fallback
+            frame.values[slot] = operation(v1, v2)
+            frame.types[slot] = result_type
+            return nxt
+    else:
+        def run():
+            frame = dst()
+            v1, t1 = read1()
+            v2, t2 = read2()
+            if t1 != t2 or t1 is None:
+                raise Fallback
+            frame.values[slot] = operation(v1, v2)
+            frame.types[slot] = result_type
+            return nxt
+    return run
+
+def idiv(v1, v2):
+    if v2 == 0:
+        raise Fallback
+    return v1 // v2
+
+def closure_MOVE(ins, nxt):
+    dst, slot = frame_accessor(ins[3]), ins[3][1]
+    read = symb_reader(ins[4])
+    def run():
+        frame = dst()
+        value, var_type = read()
+        if value is None:
+            raise Fallback
+        frame.values[slot] = value
+        frame.types[slot] = var_type
+        return nxt
+    return run
+
+def closure_DEFVAR(ins, nxt):
+    frame_name, slot = ins[3][0], ins[3][1]
+    if frame_name == 'GF':
+        add_var = gFrame.add_var
+        def run():
+            add_var(slot)
+            return nxt
+    elif frame_name == 'LF':
+        def run():
+            if lFrame is None:
+                raise Fallback
+            lFrame.add_var(slot)
+            return nxt
+    else:
+        def run():
+            if tFrame is None:
+                raise Fallback
+            tFrame.add_var(slot)
+            return nxt
+    return run
+
+def closure_CALL(ins, nxt):
+    target, back = ins[3], ins[4]
+    def run():
+        calls = cStack.call_arr
+        if len(calls) >= cStack.max_depth:
+            raise Fallback
+        calls.append(back)
+        return target
+    return run
+
+def closure_RETURN(ins, nxt):
+    def run():
+        calls = cStack.call_arr
+        return calls.pop() if calls else nxt
+    return run
+
+def closure_PUSHS(ins, nxt):
+    read = symb_reader(ins[3])
+    def run():
+        value, var_type = read()
+        dStack.push(value, var_type)
+        return nxt
+    return run
+
+def closure_POPS(ins, nxt):
+    dst, slot = frame_accessor(ins[3]), ins[3][1]
+    def run():
+        frame = dst()
+        if not dStack.values:
+            raise Fallback
+        frame.values[slot] = dStack.values.pop()
+        frame.types[slot] = dStack.types.pop()
+        return nxt
+    return run
+
+def closure_NOT(ins, nxt):
+    dst, slot = frame_accessor(ins[3]), ins[3][1]
+    read = symb_reader(ins[4])
+    def run():
+        frame = dst()
+        value, var_type = read()
+        if var_type != "bool":
+            raise Fallback
+        frame.values[slot] = not value
+        frame.types[slot] = "bool"
+        return nxt
+    return run
+
+def closure_WRITE(ins, nxt):
+    read = symb_reader(ins[3])
+    def run():
+        value, var_type = read()
+        if var_type == "bool":
+            output.write("true\n" if value else "false\n")
+        elif value != None:
+            output.write(str(value) + "\n")
         else:
-            v = var.value
-            t = var.var_type
+            output.write("\n")
+        return nxt
+    return run
+
+def closure_LABEL(ins, nxt):
+    return lambda: nxt
+
+def closure_JUMP(ins, nxt):
+    target = ins[3]
+    return lambda: target
+
+# JUMPIFEQ (jump_when True) and JUMPIFNEQ (jump_when False)
+def closure_conditional(ins, nxt, jump_when):
+    target = ins[3]
+    read1, read2 = symb_reader(ins[4]), symb_reader(ins[5])
+    def run():
+        v1, t1 = read1()
+        v2, t2 = read2()
+        if t1 != t2:
+            raise Fallback
+        if t1 is not None and (v1 == v2) == jump_when:
+            return target
+        return nxt
+    return run
+
+def closure_BREAK(ins, nxt):
+    def run():
+        raise Fallback # TRAP_BREAK needs dispatch loop
+    return run
+
+CLOSURES = {
+    'MOVE': closure_MOVE,
+    'DEFVAR': closure_DEFVAR,
+    'CALL': closure_CALL,
+    'RETURN': closure_RETURN,
+    'PUSHS': closure_PUSHS,
+    'POPS': closure_POPS,
+    'ADD': lambda ins, nxt: closure_binary(ins, nxt, operator.add, "int", "int"),
+    'SUB': lambda ins, nxt: closure_binary(ins, nxt, operator.sub, "int", "int"),
+    'MUL': lambda ins, nxt: closure_binary(ins, nxt, operator.mul, "int", "int"),
+    'IDIV': lambda ins, nxt: closure_binary(ins, nxt, idiv, "int", "int"),
+    'LT': lambda ins, nxt: closure_binary(ins, nxt, operator.lt, None, "bool"),
+    'GT': lambda ins, nxt: closure_binary(ins, nxt, operator.gt, None, "bool"),
+    'EQ': lambda ins, nxt: closure_binary(ins, nxt, operator.eq, None, "bool"),
+    'AND': lambda ins, nxt: closure_binary(ins, nxt, operator.and_, "bool", "bool"),
+    'OR': lambda ins, nxt: closure_binary(ins, nxt, operator.or_, "bool", "bool"),
+    'NOT': closure_NOT,
+    'WRITE': closure_WRITE,
+    'CONCAT': lambda ins, nxt: closure_binary(ins, nxt, operator.add, "string", "string"),
+    'LABEL': closure_LABEL,
+    'JUMP': closure_JUMP,
+    'JUMPIFEQ': lambda ins, nxt: closure_conditional(ins, nxt, True),
+    'JUMPIFNEQ': lambda ins, nxt: closure_conditional(ins, nxt, False),
+    'BREAK': closure_BREAK
+}
+
+# turns linked code to closures (after init_run, variables of global frame are bound directly)
+def compile_closures(code):
+    names = list(Instruction.opcodes)
+    closures = []
+    for index, ins in enumerate(code):
+        factory = CLOSURES.get(names[ins[1]], closure_handler)
+        closures.append(factory(ins, index + 1))
+    return closures
+
+# dispatch loop of closure engine, counts steps only when program contains BREAK or budget is set
+def execute_closures(code, closures):
+    pc = 0
+    end = len(closures)
+    steps = 0
+    limited = budget.active()
+    count_steps = Instruction.opcodes['BREAK'] in (ins[1] for ins in code)
+    pc, steps = budget.begin()
+    try:
+        while pc < end:
+            try:
+                if limited:
+                    while pc < end:
+                        stop = budget.next_check(steps)
+                        while pc < end and steps < stop:
+                            steps += 1
+                            pc = closures[pc]()
+                        if pc < end:
+                            budget.check(steps, pc, code[pc][2])
+                elif count_steps:
+                    while pc < end:
+                        steps += 1
+                        pc = closures[pc]()
+                else:
+                    while pc < end:
+                        pc = closures[pc]()
+            except Fallback:
+                ins = code[pc]
+                target = ins[0](ins)
+                if target is None:
+                    pc += 1
+                elif target >= 0:
+                    pc = target
+                else: # TRAP_BREAK
+                    Instruction.processed = steps
+                    print_state(ins[2])
+                    pc += 1
+    finally:
+        Instruction.processed = steps
+        output.flush()
+
+# ------ STATIC ANALYSIS -------
+"""
+analyze_program() builds control flow graph of basic blocks of compiled program and infers which
+states each variable of global frame may have before every instruction (MAY_* bits below).
+CALL continues at its label, RETURN at every return point and at next instruction (empty call
+stack). Local and temporary frames are not tracked, they change by CALL and PUSHFRAME, so only
+instructions with constant or GF operands are proven. Proven instructions are replaced by their
+_FAST variant by specialize() (--specialize) and translated without checks by python engine.
+"""
+MAY_UNDEFINED = 1
+MAY_NIL = 2 # defined, not initialized
+MAY_INT = 4
+MAY_BOOL = 8
+MAY_STRING = 16
+MAY_BUFFER = 32 # string kept as MutableString after SETCHAR
+MAY_VALUE = MAY_NIL | MAY_INT | MAY_BOOL | MAY_STRING # any value read from stack or untracked frame
+TYPE_BITS = {"int": MAY_INT, "bool": MAY_BOOL, "string": MAY_STRING}
+# state of var (first operand) after instruction
+RESULT_BITS = {
+    'DEFVAR': MAY_NIL,
+    'ADD': MAY_INT, 'SUB': MAY_INT, 'MUL': MAY_INT, 'IDIV': MAY_INT, 'STRLEN': MAY_INT, 'STRI2INT': MAY_INT,
+    'LT': MAY_BOOL, 'GT': MAY_BOOL, 'EQ': MAY_BOOL, 'AND': MAY_BOOL, 'OR': MAY_BOOL, 'NOT': MAY_BOOL,
+    'CONCAT': MAY_STRING, 'INT2CHAR': MAY_STRING, 'GETCHAR': MAY_STRING, 'TYPE': MAY_STRING,
+    'SETCHAR': MAY_BUFFER, 'POPS': MAY_VALUE
+}
+# required operand types of instructions with _FAST variant (None - any same type of both operands)
+FAST_OPERANDS = {
+    'ADD': MAY_INT, 'SUB': MAY_INT, 'MUL': MAY_INT, 'IDIV': MAY_INT, 'CONCAT': MAY_STRING,
+    'AND': MAY_BOOL, 'OR': MAY_BOOL, 'NOT': MAY_BOOL, 'LT': None, 'GT': None, 'EQ': None,
+    'JUMPIFEQ': None, 'JUMPIFNEQ': None, 'MOVE': MAY_INT | MAY_BOOL | MAY_STRING,
+    'WRITE': MAY_INT | MAY_BOOL | MAY_STRING, 'DEFVAR': None
+}
+
+# returns sorted indexes of first instructions of basic blocks, index after last instruction included
+def block_leaders(code):
+    names = list(Instruction.opcodes)
+    leaders = {0, len(code)}
+    for index, ins in enumerate(code):
+        name = names[ins[0]]
+        if name in ("JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS", "CALL", "RETURN"):
+            leaders.add(index + 1)
+            if name != "RETURN":
+                leaders.add(ins[2])
+    return sorted(leaders)
+
+# returns MAY_* bits of symb operand, None for variable of untracked frame
+def operand_bits(operand, state):
+    if operand[0] == None:
+        return TYPE_BITS[operand[2]]
+    if operand[0] == 'GF':
+        return state[operand[1]]
+    return None
+
+# changes state by instruction (compiled, without handler)
+def transfer(name, ins, state):
+    if name == 'MOVE':
+        bits = operand_bits(ins[3], state)
+        if bits == None:
+            bits = MAY_VALUE
+        bits &= ~MAY_UNDEFINED
+        if bits & MAY_BUFFER:
+            bits = bits & ~MAY_BUFFER | MAY_STRING
+    elif name == 'READ':
+        bits = TYPE_BITS.get(ins[3], 0)
+    elif name in ('LT', 'GT', 'EQ'):
+        bits = MAY_BOOL
+        sources = [operand_bits(operand, state) for operand in ins[3:5]]
+        if ins[2][0] == 'GF' and any(b == None or b & (MAY_NIL | MAY_UNDEFINED) for b in sources):
+            bits |= state[ins[2][1]] # both operands uninitialized - var is not changed
     else:
-        v = param.text
-        t = param.par_type
-
-    return v, t
-
-# checks string for nonallowed chars and corrects < > &, return string or raises Error
-def correct_string(s):
-    if s != None:
-        no_ws = ''.join(s.split())
-        if len(no_ws) != len(s):
-            sys.stderr.write("ERROR: Incompatible string format in XML file\n")
-            sys.exit(EXIT_CODES['LEXYCAL_OR_SYNTACTIC_ERROR'])
-        ls_o = list(s)
-        ls_n = []
-        o_code = []
-        i = 0
-        while i < (len(ls_o)):
-            if ls_o[i] == "\\":
-                try:
-                    o_code.append(ls_o[i+1])
-                    o_code.append(ls_o[i+2])
-                    o_code.append(ls_o[i+3])
-                    j = "".join(o_code)
-                    o_code = []
-                    c = chr(int(j))
-                    ls_n.append(c)
-                    i = i + 4
-                except IndexError:
-                    sys.stderr.write("ERROR: Incompatible string format in XML file\n")
-                    sys.exit(EXIT_CODES['LEXYCAL_OR_SYNTACTIC_ERROR'])
-            elif ls_o[i] == "&":
-                try:
-                    if ls_o[i+1] == "g" and ls_o[i+2] == "t" and ls_o[i+2] == ";":
-                        ls_n.append(">")
-                        i = i+3
-                    elif ls_o[i+1] == "l" and ls_o[i+2] == "t" and ls_o[i+2] == ";":
-                        ls_n.append("<")
-                        i = i + 3
-                    elif ls_o[i+1] == "a" and ls_o[i+2] == "m" and ls_o[i+2] == "p" and ls_o[i+3] == ";":
-                        ls_n.append("&")
-                        i = i + 4
-                except IndexError:
-                    sys.stderr.write("ERROR: Incompatible string format in XML file\n")
-                    sys.exit(EXIT_CODES['LEXYCAL_OR_SYNTACTIC_ERROR'])
+        bits = RESULT_BITS.get(name)
+    if bits != None and ins[2][0] == 'GF':
+        state[ins[2][1]] = bits
+
+# returns name of _FAST variant of instruction, or None and reason why it is not proven
+def specialisation(name, ins, state):
+    operands = ins[2:]
+    if name == 'DEFVAR':
+        if operands[0][0] != 'GF':
+            return None, "local or temporary frame"
+        if state[operands[0][1]] != MAY_UNDEFINED:
+            return None, "variable may be defined"
+        return name + "_FAST", None
+    if name in ('JUMPIFEQ', 'JUMPIFNEQ'):
+        sources = operands[1:]
+    elif name == 'WRITE':
+        sources = operands
+    else:
+        sources = operands[1:]
+        if operands[0][0] != 'GF':
+            return None, "local or temporary frame"
+        if state[operands[0][1]] & MAY_UNDEFINED:
+            return None, "variable may be undefined"
+    bits = [operand_bits(operand, state) for operand in sources]
+    if None in bits:
+        return None, "local or temporary frame"
+    if any(b & MAY_UNDEFINED for b in bits):
+        return None, "variable may be undefined"
+    required = FAST_OPERANDS[name]
+    if required == None:
+        proven = (bits[0] | bits[1]) in (MAY_INT, MAY_BOOL, MAY_STRING)
+    else:
+        proven = all(b & ~required == 0 for b in bits)
+    if not proven:
+        return None, "operand types not proven"
+    return name + "_FAST", None
+
+# result of analyze_program - fast[index] is name of _FAST variant or None, sites are for report
+class Analysis:
+    def __init__(self, blocks, fast, sites):
+        self.blocks = blocks
+        self.fast = fast
+        self.sites = sites
+
+    # machine-readable report of specialised sites
+    def report(self):
+        return {"blocks": self.blocks, "instructions": len(self.fast),
+                "specialised": sum(1 for site in self.sites if site["fast"]), "sites": self.sites}
+
+def analyze_program(program, code = None):
+    if code == None:
+        code = program.instructions()
+    names = list(Instruction.opcodes)
+    leaders = block_leaders(code)
+    block_of = {leader: block for block, leader in enumerate(leaders)}
+    returns = [index + 1 for index, ins in enumerate(code) if names[ins[0]] == "CALL"]
+    states = [None] * len(leaders) # state at start of block, None - not reached
+    states[0] = (MAY_UNDEFINED,) * len(program.global_names)
+    work = [0]
+    while work:
+        block = work.pop()
+        start = leaders[block]
+        if start == len(code):
+            continue
+        end = leaders[block + 1]
+        state = list(states[block])
+        for index in range(start, end):
+            transfer(names[code[index][0]], code[index], state)
+        last = code[end - 1]
+        name = names[last[0]]
+        if name == "JUMP" or name == "CALL":
+            successors = [last[2]]
+        elif name in ("JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS"):
+            successors = [end, last[2]]
+        elif name == "RETURN":
+            successors = returns + [end]
+        else:
+            successors = [end]
+        for successor in successors:
+            old = states[block_of[successor]]
+            new = tuple(state) if old == None else tuple(a | b for a, b in zip(old, state))
+            if new != old:
+                states[block_of[successor]] = new
+                work.append(block_of[successor])
+
+    fast = [None] * len(code)
+    sites = []
+    for block in range(len(leaders) - 1):
+        state = None if states[block] == None else list(states[block])
+        for index in range(leaders[block], leaders[block + 1]):
+            ins = code[index]
+            name = names[ins[0]]
+            if name in FAST_OPERANDS:
+                if state == None:
+                    fast_name, reason = None, "unreachable"
+                else:
+                    fast_name, reason = specialisation(name, ins, state)
+                fast[index] = fast_name
+                sites.append({"order": ins[1], "opcode": name, "fast": fast_name != None, "reason": reason})
+            if state != None:
+                transfer(name, ins, state)
+    return Analysis(len(leaders) - 1, fast, sites)
+
+# replaces proven instructions of linked code by their _FAST variants (code made by optimize()
+# keeps superinstructions)
+def specialize(code, analysis):
+    specialized = list(code)
+    for index, fast_name in enumerate(analysis.fast):
+        if fast_name and code[index][1] == Instruction.opcodes[fast_name[:-5]]:
+            specialized[index] = (Instruction.handlers[fast_name], Instruction.opcodes[fast_name]) + code[index][2:]
+    return specialized
+
+# ------ PYTHON ENGINE -------
+"""
+Engine selected by --engine=python. Program is split to basic blocks (leaders are first
+instruction, jump and call targets and instructions following JUMP*, CALL and RETURN) and
+translated to source of one Python function. Blocks are chosen by binary tree of ifs on pc,
+each block is while loop, so jump to start of the same block is just continue. Variables stay
+in frame lists (GF lists are bound to locals), constants are inlined and types are checked
+inline (not at all where proven by analyze_program()). When check fails, instruction is run by
+its handler (run(index)), which reports error with the same message or handles uncommon case,
+then translated code continues. Programs with
+BREAK are not translated (they need exact step count) and run on loop engine, runs with budget
+(limits, checkpoints) run on closure engine, both are reported by note on stderr.
+"""
+# expressions of symb operand - (guards, value, type), frame is bound to gv/gt, lf, tf
+def python_operand(operand):
+    frame, slot = operand[0], operand[1]
+    if frame == 'GF':
+        return [], "gv[%d]" % slot, "gt[%d]" % slot
+    local = "lf" if frame == 'LF' else "tf"
+    return [local + " is not None"], "%s.values[%d]" % (local, slot), "%s.types[%d]" % (local, slot)
+
+# guards and value of symb operand which has to be of var_type, None if constant has other type
+def python_typed(operand, var_type):
+    if operand[0] == None:
+        if operand[2] != var_type:
+            return None
+        return [], repr(operand[1])
+    guards, value, value_type = python_operand(operand)
+    guards.append("%s == %r" % (value_type, var_type))
+    if var_type == "string":
+        guards.append(value + ".__class__ is str")
+    return guards, value
+
+# guards and values of two symb operands of the same type (comparisons), None if never same
+def python_same(operand1, operand2):
+    for operand in (operand1, operand2):
+        if operand[0] == None:
+            typed1 = python_typed(operand1, operand[2])
+            typed2 = python_typed(operand2, operand[2])
+            if typed1 == None or typed2 == None:
+                return None
+            return typed1[0] + typed2[0], typed1[1], typed2[1]
+    guards1, value1, type1 = python_operand(operand1)
+    guards2, value2, type2 = python_operand(operand2)
+    guards = guards1 + guards2 + [type1 + " == " + type2, type1,
+                                  value1 + ".__class__ is not MutableString", value2 + ".__class__ is not MutableString"]
+    return guards, value1, value2
+
+# guards and value of symb operand with any initialized value
+def python_value(operand):
+    if operand[0] == None:
+        return [], repr(operand[1]), repr(operand[2])
+    guards, value, value_type = python_operand(operand)
+    guards += [value + " is not None", value + ".__class__ is not MutableString"]
+    return guards, value, value_type
+
+# translator of Program to Python source
+class PythonTranslator:
+    OPERATORS = {"ADD": "+", "SUB": "-", "MUL": "*", "IDIV": "//", "CONCAT": "+", "AND": "and", "OR": "or",
+                 "LT": "<", "GT": ">", "EQ": "=="}
+    OPERAND_TYPES = {"ADD": "int", "SUB": "int", "MUL": "int", "IDIV": "int", "CONCAT": "string", "AND": "bool", "OR": "bool"}
+    STACK_OPERATORS = {"ADDS": "+", "SUBS": "-", "MULS": "*", "IDIVS": "//", "ANDS": "and", "ORS": "or",
+                       "LTS": "<", "GTS": ">", "EQS": "=="}
+    RESULT_TYPES = {"ADD": "int", "SUB": "int", "MUL": "int", "IDIV": "int", "CONCAT": "string", "AND": "bool", "OR": "bool",
+                    "LT": "bool", "GT": "bool", "EQ": "bool"}
+
+    def __init__(self, code, proven):
+        self.code = code
+        self.proven = proven # indexes of instructions proven by analyze_program()
+        self.names = list(Instruction.opcodes)
+        self.lines = []
+        self.indent = 0
+
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    # emits guarded fast path, otherwise runs handler
+    def emit_guarded(self, index, guards, body):
+        if guards == None: # never fast
+            self.emit("run(%d)" % index)
+            return
+        if guards:
+            self.emit("if " + " and ".join(guards) + ":")
+            self.indent += 1
+        for line in body:
+            self.emit(line)
+        if guards:
+            self.indent -= 1
+            self.emit("else:")
+            self.emit("    run(%d)" % index)
+
+    # emits jump to target from block starting at leader
+    def emit_jump(self, target, leader):
+        if target == leader:
+            self.emit("continue")
+        else:
+            self.emit("pc = %d" % target)
+            self.emit("break")
+
+    # returns source of function ipp_program(code), code is linked program (for handlers)
+    def translate(self):
+        self.emit("def ipp_program(code):")
+        self.indent += 1
+        self.emit("gv, gt = gFrame.values, gFrame.types")
+        self.emit("calls, max_depth = cStack.call_arr, cStack.max_depth")
+        self.emit("dv, dt = dStack.values, dStack.types")
+        self.emit("write = output.write")
+        self.emit("def run(index):")
+        self.emit("    ins = code[index]")
+        self.emit("    return ins[0](ins)")
+        self.emit("pc = 0")
+        self.emit("while True:")
+        self.indent += 1
+        leaders = block_leaders(self.code)
+        self.dispatch(leaders, 0, len(leaders) - 1)
+        return "\n".join(self.lines) + "\n"
+
+    # binary tree of ifs choosing block by pc
+    def dispatch(self, leaders, low, high):
+        if low == high:
+            self.block(leaders, low)
+            return
+        middle = (low + high + 1) // 2
+        self.emit("if pc < %d:" % leaders[middle])
+        self.indent += 1
+        self.dispatch(leaders, low, middle - 1)
+        self.indent -= 1
+        self.emit("else:")
+        self.indent += 1
+        self.dispatch(leaders, middle, high)
+        self.indent -= 1
+
+    def block(self, leaders, position):
+        start = leaders[position]
+        if start == len(self.code):
+            self.emit("return")
+            return
+        end = leaders[position + 1]
+        self.emit("while True:")
+        self.indent += 1
+        self.emit("lf, tf = lFrame, tFrame")
+        for index in range(start, end):
+            self.instruction(index, start)
+        last = self.names[self.code[end - 1][0]]
+        if last not in ("JUMP", "CALL"):
+            self.emit_jump(end, start)
+        self.indent -= 1
+
+    def instruction(self, index, leader):
+        ins = self.code[index]
+        name = self.names[ins[0]]
+        operands = ins[2:]
+        self.emit("# order %s: %s" % (ins[1], name))
+        if name in self.OPERATORS:
+            dst_guards, dst_value, dst_type = python_operand(operands[0])
+            if name in self.OPERAND_TYPES:
+                typed1 = python_typed(operands[1], self.OPERAND_TYPES[name])
+                typed2 = python_typed(operands[2], self.OPERAND_TYPES[name])
+                guards = None if typed1 == None or typed2 == None else typed1[0] + typed2[0]
+                value1, value2 = (typed1[1], typed2[1]) if guards != None else (None, None)
+            else:
+                same = python_same(operands[1], operands[2])
+                guards, value1, value2 = same if same != None else (None, None, None)
+            if guards != None:
+                guards = [] if index in self.proven else dst_guards + [dst_type + " is not False"] + guards
+                if name == "IDIV":
+                    guards.append(value2 + " != 0")
+            self.emit_guarded(index, guards, ["%s = %s %s %s" % (dst_value, value1, self.OPERATORS[name], value2),
+                                              "%s = %r" % (dst_type, self.RESULT_TYPES[name])])
+        elif name == "NOT":
+            dst_guards, dst_value, dst_type = python_operand(operands[0])
+            typed = python_typed(operands[1], "bool")
+            guards = None if typed == None else dst_guards + [dst_type + " is not False"] + typed[0]
+            if index in self.proven:
+                guards = []
+            self.emit_guarded(index, guards, ["%s = not %s" % (dst_value, typed and typed[1]), dst_type + " = 'bool'"])
+        elif name == "MOVE":
+            dst_guards, dst_value, dst_type = python_operand(operands[0])
+            guards, value, value_type = python_value(operands[1])
+            guards = [] if index in self.proven else dst_guards + [dst_type + " is not False"] + guards
+            self.emit_guarded(index, guards, [dst_value + " = " + value, dst_type + " = " + value_type])
+        elif name == "DEFVAR":
+            dst_guards, dst_value, dst_type = python_operand(operands[0])
+            guards = [] if index in self.proven else dst_guards + [dst_type + " is False"]
+            self.emit_guarded(index, guards, [dst_value + " = None", dst_type + " = None"])
+        elif name == "PUSHS":
+            if operands[0][0] == None:
+                guards, value, value_type = [], repr(operands[0][1]), repr(operands[0][2])
+            else:
+                guards, value, value_type = python_operand(operands[0])
+                guards += [value_type + " is not False", value + ".__class__ is not MutableString"]
+            self.emit_guarded(index, guards, ["dv.append(%s)" % value, "dt.append(%s)" % value_type])
+        elif name == "POPS":
+            dst_guards, dst_value, dst_type = python_operand(operands[0])
+            self.emit_guarded(index, dst_guards + [dst_type + " is not False", "dv"], [dst_value + " = dv.pop()", dst_type + " = dt.pop()"])
+        elif name == "WRITE":
+            operand = operands[0]
+            if operand[0] == None:
+                self.emit("write(%r)" % (value_text(operand[1], operand[2]) + "\n"))
+            else:
+                guards, value, value_type = python_operand(operand)
+                guards = [] if index in self.proven else guards + [value_type + " is not False"]
+                self.emit_guarded(index, guards, [
+                    "if %s == 'bool':" % value_type,
+                    "    write('true\\n' if %s else 'false\\n')" % value,
+                    "elif %s is not None:" % value,
+                    "    write(str(%s) + '\\n')" % value,
+                    "else:",
+                    "    write('\\n')"])
+        elif name in ("CREATEFRAME", "PUSHFRAME", "POPFRAME"):
+            self.emit("run(%d)" % index)
+            self.emit("lf, tf = lFrame, tFrame")
+        elif name == "LABEL":
+            self.emit("pass")
+        elif name == "JUMP":
+            self.emit_jump(operands[0], leader)
+        elif name in ("JUMPIFEQ", "JUMPIFNEQ"):
+            same = python_same(operands[1], operands[2])
+            comparison = "==" if name == "JUMPIFEQ" else "!="
+            if index in self.proven:
+                self.emit("if %s %s %s:" % (same[1], comparison, same[2]))
+            elif same == None:
+                self.emit("if run(%d) is not None:" % index)
             else:
-                ls_n.append(ls_o[i])
-                i = i+1
-        s_n = "".join(ls_n)
-        return s_n
+                guards, value1, value2 = same
+                self.emit("if %s:" % (" and ".join(guards) or "True"))
+                self.emit("    if %s %s %s:" % (value1, comparison, value2))
+                self.indent += 2
+                self.emit_jump(operands[0], leader)
+                self.indent -= 2
+                self.emit("elif run(%d) is not None:" % index)
+            self.indent += 1
+            self.emit_jump(operands[0], leader)
+            self.indent -= 1
+        elif name in self.STACK_OPERATORS:
+            guards = ["len(dv) > 1"]
+            if name[:-1] in self.OPERAND_TYPES:
+                guards += ["dt[-1] == %r" % self.OPERAND_TYPES[name[:-1]], "dt[-2] == %r" % self.OPERAND_TYPES[name[:-1]]]
+            else:
+                guards += ["dt[-1] == dt[-2]", "dt[-1] is not None"]
+            if name == "IDIVS":
+                guards.append("dv[-1] != 0")
+            body = ["dt.pop()", "symb2 = dv.pop()", "dv[-1] = dv[-1] %s symb2" % self.STACK_OPERATORS[name]]
+            if self.RESULT_TYPES[name[:-1]] != self.OPERAND_TYPES.get(name[:-1]):
+                body.append("dt[-1] = %r" % self.RESULT_TYPES[name[:-1]])
+            self.emit_guarded(index, guards, body)
+        elif name in ("JUMPIFEQS", "JUMPIFNEQS"):
+            self.emit("if len(dv) > 1 and dt[-1] == dt[-2] and dt[-1] is not None:")
+            self.emit("    dt.pop()")
+            self.emit("    dt.pop()")
+            self.emit("    symb2 = dv.pop()")
+            self.emit("    if dv.pop() %s symb2:" % ("==" if name == "JUMPIFEQS" else "!="))
+            self.indent += 2
+            self.emit_jump(operands[0], leader)
+            self.indent -= 2
+            self.emit("elif run(%d) is not None:" % index)
+            self.indent += 1
+            self.emit_jump(operands[0], leader)
+            self.indent -= 1
+        elif name == "CALL":
+            self.emit("if len(calls) >= max_depth:")
+            self.emit("    run(%d)" % index)
+            self.emit("calls.append(%d)" % operands[1])
+            self.emit_jump(operands[0], leader)
+        elif name == "RETURN":
+            self.emit("if calls:")
+            self.emit("    pc = calls.pop()")
+            self.emit("    break")
+        else:
+            self.emit("run(%d)" % index)
+
+# returns Python source of program or None when program cannot be translated (BREAK)
+def translate_program(program):
+    if Instruction.opcodes['BREAK'] in program.opcodes:
+        return None
+    code = program.instructions()
+    analysis = analyze_program(program, code)
+    proven = {index for index, fast_name in enumerate(analysis.fast) if fast_name}
+    return PythonTranslator(code, proven).translate()
+
+# translates and compiles program to code object, False when program cannot be translated
+def compile_python(program):
+    source = translate_program(program)
+    if source == None:
+        return False
+    return compile(source, "<ippcode18>", "exec")
+
+# runs linked code by translated function (Program.python), program loaded without translation
+# is translated now, program which cannot be translated runs on loop engine and run with budget
+# on closure engine (translated code does not count steps), both with note on stderr
+def execute_python(code, program):
+    if program.python == None:
+        program.python = compile_python(program)
+    if not program.python:
+        error_output.write("NOTE: program with BREAK is not translated to Python, it runs on loop engine\n")
+        execute(code)
+        return
+    if budget.active():
+        error_output.write("NOTE: translated program does not count steps, run with limits or checkpoints runs on closure engine\n")
+        execute_closures(code, compile_closures(code))
+        return
+    namespace = {}
+    exec(program.python, globals(), namespace)
+    try:
+        namespace['ipp_program'](code)
+    finally:
+        output.flush()
+
+# ------ PROFILER -------
+# execution counts and times of instructions collected by execute_profiled() (--profile)
+class Profile:
+    def __init__(self, code, labels):
+        self.code = code
+        self.labels = labels # label name -> order
+        self.counts = [0] * len(code) # executions of instruction at index
+        self.times = [0.0] * len(code) # cumulative time of instruction at index
+        self.calls = [0] * (len(code) + 1) # CALLs to target index
+        self.jumps = [0] * (len(code) + 1) # taken jumps and returns to target index
+        self.steps = 0
+        self.time = 0.0
+
+    # builds report - per opcode, per instruction order and per label, sorted by time
+    def report(self):
+        names = {code: name for name, code in Instruction.opcodes.items()}
+        opcodes = {}
+        instructions = []
+        for index, ins in enumerate(self.code):
+            if self.counts[index] == 0:
+                continue
+            name = names[ins[1]]
+            stat = opcodes.setdefault(name, {"opcode": name, "count": 0, "time": 0.0})
+            stat["count"] += self.counts[index]
+            stat["time"] += self.times[index]
+            instructions.append({"order": ins[2], "opcode": name, "count": self.counts[index], "time": self.times[index]})
+
+        # label region - instructions from label to next label (function body or loop)
+        label_at = {int(order) - 1: name for name, order in self.labels.items()}
+        label_list = []
+        region = None
+        for index, ins in enumerate(self.code):
+            if index in label_at:
+                target = index + 1
+                region = {"label": label_at[index], "order": ins[2], "calls": self.calls[target], "jumps": self.jumps[target],
+                          "fallthrough": self.counts[index], "entries": self.calls[target] + self.jumps[target] + self.counts[index],
+                          "steps": 0, "time": 0.0}
+                label_list.append(region)
+            if region != None:
+                region["steps"] += self.counts[index]
+                region["time"] += self.times[index]
+
+        by_time = lambda stat: (-stat["time"], -stat["count"] if "count" in stat else -stat["steps"])
+        return {
+            "steps": self.steps,
+            "time": self.time,
+            "opcodes": sorted(opcodes.values(), key = by_time),
+            "instructions": sorted(instructions, key = by_time),
+            "labels": sorted(label_list, key = by_time)
+        }
+
+    # writes report to <path>.json and <path>.txt
+    def write(self, path):
+        report = self.report()
+        with open(path + '.json', 'w') as f:
+            json.dump(report, f, indent = 2)
+        with open(path + '.txt', 'w') as f:
+            f.write("PROFILE | Instruction count (" + str(report["steps"]) + ") | Time (" + "%.6f" % report["time"] + " s)\n")
+            f.write("\n$ OPCODES as (OPCODE, COUNT, TIME):\n")
+            for s in report["opcodes"]:
+                f.write("%-16s %12d %12.6f\n" % (s["opcode"], s["count"], s["time"]))
+            f.write("\n$ INSTRUCTIONS as (ORDER, OPCODE, COUNT, TIME):\n")
+            for s in report["instructions"]:
+                f.write("%-8s %-16s %12d %12.6f\n" % (s["order"], s["opcode"], s["count"], s["time"]))
+            f.write("\n$ LABELS as (LABEL, ORDER, CALLS, JUMPS, FALLTHROUGH, STEPS, TIME):\n")
+            for s in report["labels"]:
+                f.write("%-16s %-8s %10d %10d %10d %12d %12.6f\n" % (s["label"], s["order"], s["calls"], s["jumps"], s["fallthrough"], s["steps"], s["time"]))
+
+# dispatch loop of execute() measuring each instruction, used only with --profile
+def execute_profiled(code, profile):
+    clock = time.perf_counter
+    counts = profile.counts
+    times = profile.times
+    call_opcode = Instruction.opcodes['CALL']
+    end = len(code)
+    limited = budget.active()
+    pc, steps = budget.begin()
+    check = budget.next_check(steps)
+    start = clock()
+    try:
+        while pc < end:
+            if limited and steps >= check:
+                budget.check(steps, pc, code[pc][2])
+                check = budget.next_check(steps)
+            ins = code[pc]
+            steps += 1
+            t = clock()
+            target = ins[0](ins)
+            times[pc] += clock() - t
+            counts[pc] += 1
+            if target is None:
+                pc += 1
+            elif target >= 0:
+                if ins[1] == call_opcode:
+                    profile.calls[target] += 1
+                else:
+                    profile.jumps[target] += 1
+                pc = target
+            else: # TRAP_BREAK
+                Instruction.processed = steps
+                print_state(ins[2])
+                pc += 1
+    finally:
+        Instruction.processed = steps
+        profile.steps = steps
+        profile.time = clock() - start
+        output.flush()
+
+# validates one <instruction> element, returns Instruction or raises LoadError, strings are
+# decoded literals (see correct_string)
+def load_instruction(inst, xml_file, strings):
+    inst_attrib = ["order", "opcode"]
+
+    if inst.tag != "instruction": # not instruction tag
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file: ' + str(xml_file) + ' - instruction tag: ' + str(inst.tag) + "\n")
+    check_attributes(inst.tag, inst.attrib, inst_attrib)
+    f_ord = inst.get('order') # tag has order attribute
+    if not f_ord: # instruction without order attribute
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file ' + str(xml_file) + ' - order attribute missing\n')
+    if not is_int(f_ord): # order attribute valid integer
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file ' + str(xml_file) + ' - order attribute is not integer\n')
+    if int(f_ord) < 1: # order out of range (upper bound is checked when whole file is read)
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid instruction order: ' + str(f_ord) + "\n")
+    try:
+        return load_operation(inst, f_ord, xml_file, strings)
+    except LoadError as e:
+        e.order = f_ord # order is checked before the error is reported
+        raise
+
+# validates opcode and arguments of <instruction> element with valid order, returns Instruction
+def load_operation(inst, f_ord, xml_file, strings):
+    arg_tags = ["arg1", "arg2", "arg3"]
+    arg_attrib = ["type"]
+
+    f_name = inst.get('opcode')
+    if not f_name:
+        # instruction without opcode attribute
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file: ' + str(xml_file) + ' - opcode attribute missing at order: ' + str(f_ord) + "\n")
+    # check for valid instruction name
+    f_match = Instruction.inst_args.get(f_name)
+    if f_match == None:
+        # invalid function (not recognized)
+        raise LoadError('UNDEFINED_INSTRUCTION', 'ERROR: Not recognized instruction: ' + str(f_name) + " at order: " + str(f_ord) + "\n")
+    arg_num = len(f_match) # gets number of arguments
+    if len(inst) != arg_num:
+        # incorrect number of arguments
+        raise LoadError('LEXYCAL_OR_SYNTACTIC_ERROR', 'ERROR: Incorrect number of arguments in instruction: ' + str(f_name) + ' - at order: ' + str(f_ord) + " - given: " + str(len(inst)) + " (expected " + str(arg_num) + ")\n")
+    tmp_arg_sheme = arg_tags[:arg_num] # allowed arg tags
+    parameter_list = ['x'] * arg_num
+    for arg in inst:
+        if arg.tag not in arg_tags: # arg1, arg2, arg3
+            raise LoadError('BAD_XML_FORMAT', 'ERROR: Instruction: ' + str(f_name) +' at order: ' + str(f_ord) + ' has invalid argument tag.\n')
+        check_attributes(arg.tag, arg.attrib, arg_attrib)
+        try:
+            tmp_arg_sheme.remove(arg.tag)
+        except ValueError:
+            raise LoadError('BAD_XML_FORMAT', 'ERROR: Instruction: ' + str(f_name) + ' at order: ' + str(f_ord) + ' has invalid argument tag.\n')
+        text = arg.text
+        if arg.get('type') == 'string':
+            text = correct_string(text, strings)
+        p = Parameter(arg.tag, text, arg.get('type'))
+        if not p.check_type(): # checks only according to given type
+            raise LoadError('LEXYCAL_OR_SYNTACTIC_ERROR', 'ERROR: Instruction: ' + str(f_name) + ' at order: ' + str(f_ord) + ' argument: ' + str(arg.tag) +' has incompatible type: ' + str(arg.get('type')) + ' with given value: ' + str(text) + "\n")
+        parameter_list[int(arg.tag[-1]) - 1] = p # index already checked
+    # Instruction (order, function_name, parameter_list)
+    return Instruction(f_ord, f_name, parameter_list)
+
+# reads and validates XML source as stream of elements, returns compiled Program, raises LoadError
+# Processed elements are dropped, so memory keeps only compiled instructions. After first
+# validation error the rest of file is only checked for well-formedness, to report
+# malformed XML first as when whole document was parsed at once.
+def load_program(xml_file):
+    error = None # first validation error
+    with open(xml_file, 'rb') as f:
+        # ------ HEADER -------
+        # check valid xml header (mandatory in this project)
+        # <?xml version="1.0" encoding="UTF-8"?>
+        if not re.match(rb"<\?xml.*\?>", f.readline()):
+            error = LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file - no header found: ' + str(xml_file) + "\n")
+        f.seek(0)
+        builder = ProgramBuilder()
+        xml_len, error = read_instructions(f, xml_file, builder.add, error)
+    return builder.finish(xml_len, error, xml_file)
+
+# validates elements of XML stream, passes valid instructions to add in document order, returns
+# (number of root children, first validation error), raises LoadError when XML is not well-formed
+def read_instructions(f, xml_file, add, error = None):
+    program_attrib = ["language", "name", "description"]
+
+    strings = {} # decoded string literals
+    xml_len = 0 # number of root children
+    depth = 0
+    root = None
+
+    # ------ XML VERIFICATION -------
+    # root = program tag (attributes name and description allowed as optonal)
+    # inst = instruction tag (attributes order and opcode requested as mandatory)
+    # arg = artument tag (attributes type requested as mandatory)
+    try:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = elem
+                    if error == None:
+                        try:
+                            check_attributes(root.tag, root.attrib, program_attrib)
+                        except LoadError as e:
+                            error = e
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1: # only complete children of root are processed
+                continue
+            xml_len += 1
+            if error == None:
+                try:
+                    add(load_instruction(elem, xml_file, strings))
+                except LoadError as e:
+                    error = e
+            root.clear() # drop processed instruction
+    except (ET.ParseError, EX.ExpatError):
+        raise LoadError('BAD_XML_FORMAT', 'ERROR: Invalid XML file: ' + str(xml_file) + "\n")
+    return xml_len, error
+
+# ------ PARALLEL VALIDATION -------
+"""
+--validate-jobs=<n> validates big XML sources on pool of n processes. File is split to chunks
+before <instruction tags, each chunk is completed to document by the part of file before first
+instruction (header and root start tag) and root end tag, and validated by read_instructions()
+in worker. Instructions of all chunks are compiled in document order, labels and orders are checked
+for whole program by ProgramBuilder. A split which is not between two root children (comment,
+nested element) makes a chunk malformed. When any chunk is malformed or invalid, or label is
+defined in two chunks, whole file is loaded again by load_program(), so the first error and exit
+code are always the same as without --validate-jobs.
+"""
+INSTRUCTION_START = re.compile(rb'<instruction[\s/>]')
+VALIDATION_CHUNKS = 4 # chunks per process
+VALIDATION_MIN_CHUNK = 1000 # instructions, smaller programs are validated serially
+
+# returns raw name of root element when head is only XML declaration and root start tag, or None
+def root_name(head):
+    names = []
+    parser = EX.ParserCreate()
+    parser.StartElementHandler = lambda name, attributes: names.append(name)
+    try:
+        parser.Parse(head, False)
+    except EX.ExpatError:
+        return None
+    return names[0] if len(names) == 1 else None
+
+# validates one chunk in worker, returns (instructions as plain data, number of root children)
+# or None when chunk is malformed or invalid
+def validate_chunk(args):
+    xml_file, head_end, start, end, closing = args
+    with open(xml_file, 'rb') as f:
+        head = f.read(head_end)
+        f.seek(start)
+        body = f.read(end - start) if end != None else f.read()
+    loaded = []
+    try:
+        xml_len, error = read_instructions(io.BytesIO(head + body + closing), xml_file, loaded.append)
+    except LoadError:
+        return None
+    if error != None:
+        return None
+    return [(i.order, i.name, [(p.tag, p.text, p.par_type) for p in i.parameter_list]) for i in loaded], xml_len
+
+# load_program() on pool of jobs processes, returns Program, raises LoadError
+def load_program_parallel(xml_file, jobs):
+    with open(xml_file, 'rb') as f:
+        if not re.match(rb"<\?xml.*\?>", f.readline()):
+            return load_program(xml_file)
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            starts = [m.start() for m in INSTRUCTION_START.finditer(data)]
+            head = data[:starts[0]] if starts else b""
+    name = root_name(head)
+    chunk_count = min(jobs * VALIDATION_CHUNKS, len(starts) // VALIDATION_MIN_CHUNK)
+    if name == None or chunk_count < 2:
+        return load_program(xml_file)
+
+    step = -(-len(starts) // chunk_count)
+    bounds = starts[::step] + [None]
+    closing = ("</" + name + ">").encode()
+    chunks = [(xml_file, starts[0], bounds[i], bounds[i + 1], closing if bounds[i + 1] != None else b"") for i in range(len(bounds) - 1)]
+    with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+        results = pool.map(validate_chunk, chunks, chunksize = 1)
+
+    builder = ProgramBuilder()
+    xml_len = 0
+    for result in results:
+        if result == None:
+            return load_program(xml_file)
+        try:
+            for order, name, parameters in result[0]:
+                builder.add(Instruction(order, name, [Parameter(tag, text, par_type) for tag, text, par_type in parameters]))
+        except LoadError: # label defined in another chunk
+            return load_program(xml_file)
+        xml_len += result[1]
+    return builder.finish(xml_len, None, xml_file)
+
+# ------ SOURCE FRONT-END -------
+"""
+--source-format=code reads IPPcode18 source directly, without parse.php and XML. Lines are checked
+as parse.php does - header .IPPcode18, comments from # to end of line, instruction names in any
+case, number of arguments by Instruction.inst_args (instruction_list of parse.php) - and also the
+type of every argument. Errors have exit codes of parse.php (20, 21), semantic errors (labels)
+the same as XML source.
+"""
+SOURCE_NAME = re.compile(r'[a-zA-Z_\-$&%*][a-zA-Z0-9_\-$&%*]*') # variable or label, not starting with digit
+SOURCE_INT = re.compile(r'[+-]?[0-9]+')
+SOURCE_STRING = re.compile(r'(?:[^\\]|\\[0-9]{3})*') # backslash only in escape sequence \ddd
+# argument types allowed for kinds of Instruction.inst_args
+SOURCE_KINDS = {'v': ('var',), 's': ('var', 'int', 'bool', 'string'), 'l': ('label',), 't': ('type',)}
+
+# returns (type, text) of source argument as in XML arg element, None for invalid argument
+def source_argument(word):
+    if '@' in word:
+        prefix, value = word.split('@', 1)
+        if prefix == "string" and SOURCE_STRING.fullmatch(value):
+            return "string", value
+        elif prefix == "bool" and value in ("true", "false"):
+            return "bool", value
+        elif prefix == "int" and SOURCE_INT.fullmatch(value):
+            return "int", value
+        elif prefix in ("GF", "LF", "TF") and SOURCE_NAME.fullmatch(value):
+            return "var", word
+        return None
+    elif word in ("int", "bool", "string"):
+        return "type", word
+    elif SOURCE_NAME.fullmatch(word):
+        return "label", word
+    return None
+
+# reads and validates IPPcode18 source, returns Program as load_program(), raises LoadError
+def load_source(source_file):
+    builder = ProgramBuilder()
+    count = 0 # instructions
+    strings = {} # decoded string literals
+    try:
+        with open(source_file, encoding = 'utf-8', newline = '\n') as f:
+            header = f.readline()
+            if len(header) <= 10 or header[:10].lower() != ".ippcode18":
+                raise LoadError('SOURCE_HEADER_ERROR', 'ERROR: Missing ".IPPcode18" at the beginning of source code: ' + str(source_file) + "\n")
+            for line_num, line in enumerate(f, 2):
+                words = line.split('#', 1)[0].split()
+                if not words: # just comments or white spaces
+                    continue
+                name = words[0].upper()
+                kinds = Instruction.inst_args.get(name)
+                if kinds == None:
+                    raise LoadError('SOURCE_SYNTAX_ERROR', 'ERROR: Not recognized instruction in line ' + str(line_num) + ': ' + str(words[0]) + "\n")
+                if len(words) - 1 != len(kinds):
+                    raise LoadError('SOURCE_SYNTAX_ERROR', 'ERROR: Incorrect number of arguments in line ' + str(line_num) + ' - given: ' + str(len(words) - 1) + " (expected " + str(len(kinds)) + ")\n")
+                parameter_list = []
+                for index, (word, kind) in enumerate(zip(words[1:], kinds), 1):
+                    arg = source_argument(word)
+                    if arg == None or arg[0] not in SOURCE_KINDS[kind]:
+                        raise LoadError('SOURCE_SYNTAX_ERROR', 'ERROR: Incorrect type of argument ' + str(index) + ' in line ' + str(line_num) + ': ' + str(word) + "\n")
+                    arg_type, text = arg
+                    if arg_type == "string":
+                        text = correct_string(text, strings)
+                    parameter_list.append(Parameter('arg' + str(index), text, arg_type))
+                count += 1
+                builder.add(Instruction(str(count), name, parameter_list))
+    except UnicodeDecodeError:
+        raise LoadError('SOURCE_SYNTAX_ERROR', 'ERROR: Source code is not valid UTF-8: ' + str(source_file) + "\n")
+    return builder.finish(count)
+
+# ------ PROGRAM CACHE -------
+"""
+Validated and compiled programs are stored as marshal dumps in cache directory. File name is hash of
+XML source together with interpreter version (hash of this script and Python version),
+so any change of source or interpret makes new entry. Least recently used entries are
+removed when size of cache exceeds its limit. Cache is enabled by --cache or --cache-dir, when
+directory cannot be created or written, programs are just not cached. A run does not write to home
+directory unless asked, so --compile-only fills the cache only together with --cache or --cache-dir,
+without them it just validates the source.
+"""
+CACHE_MAX_SIZE = 64 # MiB
+
+# default cache directory ($XDG_CACHE_HOME/ipp-interpret or ~/.cache/ipp-interpret)
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ipp-interpret')
+
+# hash of this script and Python version (marshal format depends on it)
+def interpreter_version():
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha256(f.read() + sys.version.encode()).hexdigest()
+
+# converts Program to compact binary form
+def dump_program(program):
+    return marshal.dumps((program.opcodes.tobytes(), program.operands.tobytes(), program.operand_table, program.texts, program.global_names,
+                          program.local_names, program.label_names, program.label_indexes.tobytes(), program.orders, program.python))
+
+# converts binary form made by dump_program() back to Program
+def restore_program(data):
+    opcodes, operands, operand_table, texts, global_names, local_names, label_names, label_indexes, orders, python = marshal.loads(data)
+    return Program(array.array('B', opcodes), bytes_array('i', operands), operand_table, texts, global_names,
+                   local_names, label_names, bytes_array('i', label_indexes), orders, python)
+
+# array of given type code with items from bytes made by array.tobytes()
+def bytes_array(typecode, data):
+    result = array.array(typecode)
+    result.frombytes(data)
+    return result
+
+# on-disk cache of compiled programs, all disk errors just disable caching
+class ProgramCache:
+    suffix = '.ippc'
+
+    def __init__(self, directory, max_size = CACHE_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size * 1024 * 1024
+        self.version = interpreter_version()
+
+    # returns cache key of given source file (XML or IPPcode18 by source_format)
+    def key(self, xml_file, source_format = "xml"):
+        h = hashlib.sha256((self.version + source_format).encode())
+        with open(xml_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ProgramCache.suffix)
+
+    # returns Program stored under key or None
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                program = restore_program(f.read())
+            os.utime(path) # mark as recently used
+            return program
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    # stores program under key, then evicts old entries
+    def store(self, key, program):
+        path = self.path(key)
+        tmp = path + '.' + str(os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            with open(tmp, 'wb') as f:
+                f.write(dump_program(program))
+            os.replace(tmp, path) # atomic, concurrent runs never see partial file
+            self.evict()
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                ...
+
+    # removes least recently used entries until cache fits max_size
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(ProgramCache.suffix):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+# execution engines (--engine), each runs linked code of program after init_run
+ENGINES = {
+    "loop": lambda code, program: execute(code),
+    "closure": lambda code, program: execute_closures(code, compile_closures(code)),
+    "python": execute_python
+}
+
+# returns compiled Program of xml file (IPPcode18 source with source_format code) - from cache or
+# loaded and stored to cache, raises LoadError, with python also translated to Python (see PYTHON ENGINE),
+# XML is validated on validate_jobs processes (see PARALLEL VALIDATION)
+def get_program(xml_file, cache = None, python = False, source_format = "xml", validate_jobs = 1):
+    # verify xml file access
+    if os.path.exists(xml_file): # exists
+        if not os.access(xml_file, os.R_OK): # not readable
+            raise LoadError('INPUT_FILE_ERROR', 'ERROR: File is not readable: ' + str(xml_file) + "\n")
+    else: # doesn't exist
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: File does not exist: ' + str(xml_file) + "\n")
+
+    program = None
+    if cache:
+        key = cache.key(xml_file, source_format)
+        program = cache.load(key)
+    if program == None:
+        if source_format == "code":
+            program = load_source(xml_file)
+        elif validate_jobs > 1:
+            program = load_program_parallel(xml_file, validate_jobs)
+        else:
+            program = load_program(xml_file)
+        if python:
+            program.python = compile_python(program)
+        if cache:
+            cache.store(key, program)
+    elif python and program.python == None:
+        program.python = compile_python(program)
+        if cache:
+            cache.store(key, program)
+    return program
+
+# ------ INTERPRETER API -------
+"""
+In-process use without sys.exit:
+    interpreter = Interpreter(engine = "closure")
+    program = interpreter.load("program.xml")          # raises LoadError
+    result = interpreter.run(program, stdin = io.BytesIO(b"input\n"))
+    result.exit_code, result.output, result.errors
+Program is loaded once and can be run many times, also by more threads at once. Each run starts
+with fresh frames and stacks (init_run) in its own run context - separate namespace of this script
+with its own frames, stacks, program streams, budget and symbol tables. Handlers and engines find
+the state of their run in their globals as when interpret.py runs from command line, so dispatch
+is not slowed down by passing context. Contexts are made on first use (the first one compiles this
+script) and kept for later runs, runs at the same time take different contexts and do not wait
+for each other. Error messages, DPRINT and BREAK of the run are written to its own error stream
+(RunResult.errors), sys.stderr of the process is not touched.
+"""
+# result of one run
+class RunResult:
+    def __init__(self, exit_code, output, errors, steps = 0):
+        self.exit_code = exit_code # as exit code of interpret.py
+        self.output = output # bytes written by program, None when stdout stream was given
+        self.errors = errors # text written to stderr (error message, DPRINT, BREAK), None when stderr stream was given
+        self.steps = steps # executed instructions, closure engine counts them only with limits or BREAK, python engine never
+
+# namespaces of this script for runs of Interpreter (see INTERPRETER API), namespace is used by one
+# run at a time
+class ContextPool:
+    def __init__(self):
+        self.code = None # compiled script, made by first acquire()
+        self.free = []
+        self.lock = threading.Lock()
+
+    # returns namespace which is not used by any run
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            if self.code == None:
+                with open(__file__, 'rb') as f:
+                    self.code = compile(f.read(), __file__, 'exec')
+        namespace = {'__name__': 'interpret_run', '__file__': __file__}
+        exec(self.code, namespace)
+        return namespace
+
+    # takes namespace of finished run, state of the run is dropped
+    def release(self, namespace):
+        namespace['init_run'](io.BytesIO(), io.BytesIO(), io.StringIO())
+        with self.lock:
+            self.free.append(namespace)
+
+run_contexts = ContextPool()
+
+# runs program by options of interpreter (Interpreter) with state in globals of this module,
+# returns (exit code, executed instructions)
+def run_program(interpreter, program, stdin, stdout, stderr, input_file):
+    try:
+        code = link_program(program)
+        init_run(stdout, stdin, stderr)
+        cStack.max_depth = interpreter.max_call_depth
+        budget.max_steps, budget.max_time, budget.max_memory = interpreter.budget
+        if input_file != None:
+            try:
+                program_input.open_file(input_file)
+            except OSError:
+                raise LoadError('INPUT_FILE_ERROR', 'ERROR: Input file cannot be read: ' + str(input_file) + "\n")
+        if interpreter.optimize and interpreter.engine != "python":
+            code = optimize(code)
+        if interpreter.specialize and interpreter.engine != "python":
+            code = specialize(code, analyze_program(program))
+        ENGINES[interpreter.engine](code, program)
+        exit_code = EXIT_CODES['OK']
+    except LoadError as e:
+        stderr.write(e.message)
+        exit_code = EXIT_CODES[e.code]
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else EXIT_CODES['INTERNAL_ERROR']
+    except Exception as e:
+        stderr.write('ERROR: Internal error: ' + repr(e) + "\n")
+        exit_code = EXIT_CODES['INTERNAL_ERROR']
+    finally:
+        if input_file != None and program_input.stream != None:
+            program_input.stream.close()
+    return exit_code, Instruction.processed
+
+class Interpreter:
+    def __init__(self, engine = "loop", optimize = False, specialize = False, cache = None, max_call_depth = CallStack.MAX_DEPTH,
+                 max_steps = None, max_time = None, max_memory = None, source_format = "xml"):
+        if engine not in ENGINES:
+            raise ValueError("unknown engine: " + str(engine))
+        self.engine = engine
+        self.optimize = optimize
+        self.specialize = specialize
+        self.cache = cache # ProgramCache or None
+        self.max_call_depth = max_call_depth
+        self.budget = (max_steps, max_time, max_memory) # see Budget
+        self.source_format = source_format # xml or code (IPPcode18 source)
+
+    # loads and compiles source file, returns Program, raises LoadError
+    def load(self, xml_file):
+        return get_program(xml_file, self.cache, self.engine == "python", self.source_format)
+
+    # runs program, stdin and stdout are binary streams, stderr is text stream (empty input,
+    # captured output and errors when not given), input_file is read instead of stdin, returns RunResult
+    def run(self, program, stdin = None, stdout = None, input_file = None, stderr = None):
+        captured = io.BytesIO() if stdout == None else stdout
+        errors = io.StringIO() if stderr == None else stderr
+        context = run_contexts.acquire()
+        try:
+            exit_code, steps = context['run_program'](self, program, io.BytesIO() if stdin == None else stdin, captured, errors, input_file)
+        finally:
+            run_contexts.release(context)
+        return RunResult(exit_code, captured.getvalue() if stdout == None else None, errors.getvalue() if stderr == None else None, steps)
+
+# ------ BATCH MODE -------
+"""
+Batch mode (--batch=<manifest>) runs many programs in one process per core. Manifest is JSON list
+of jobs {"source": xml file, "input": file, "output": expected output file, "rc": expected exit code},
+only "source" is required, relative paths are relative to manifest. Jobs are run by Interpreter
+of the worker, nothing from previous job is reused except loaded programs in cache.
+"""
+# options and Interpreter of this worker, set by init_worker
+batch_options = {}
+
+def init_worker(options):
+    batch_options.update(options)
+    cache = ProgramCache(options['cache_dir'], options['cache_size']) if options['cache_dir'] else None
+    batch_options['interpreter'] = Interpreter(options['engine'], options['optimize'], options['specialize'], cache,
+                                               max_steps = options['max_steps'], max_time = options['max_time'], max_memory = options['max_memory'],
+                                               source_format = options['source_format'])
+
+# reads manifest, returns list of jobs with paths relative to current directory
+def load_manifest(path):
+    try:
+        with open(path, 'rb') as f:
+            jobs = json.loads(f.read().decode())
+    except (OSError, ValueError):
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: Manifest cannot be read: ' + str(path) + "\n")
+    if not isinstance(jobs, list):
+        raise LoadError('INPUT_FILE_ERROR', 'ERROR: Manifest is not list of jobs: ' + str(path) + "\n")
+    base = os.path.dirname(path)
+    for job in jobs:
+        if not isinstance(job, dict) or not isinstance(job.get('source'), str):
+            raise LoadError('INPUT_FILE_ERROR', 'ERROR: Job without source in manifest: ' + str(job) + "\n")
+        for name in ('source', 'input', 'output'):
+            if job.get(name) != None:
+                job[name] = os.path.join(base, job[name])
+    return jobs
+
+# runs one job, returns its result (exit code, stderr, comparison with expected output and exit code)
+def run_job(job):
+    start = time.perf_counter()
+    interpreter = batch_options['interpreter']
+    try:
+        result = interpreter.run(interpreter.load(job['source']), input_file = job.get('input'))
+        rc, stdout, error = result.exit_code, result.output, result.errors
+    except LoadError as e:
+        rc, stdout, error = EXIT_CODES[e.code], b"", e.message
+
+    result = {"source": job['source'], "rc": rc, "expected_rc": job.get('rc', 0), "output": None, "stderr": error}
+    if job.get('output') != None:
+        try:
+            with open(job['output'], 'rb') as f:
+                result["output"] = f.read() == stdout
+        except OSError:
+            result["output"] = False
+    result["passed"] = rc == result["expected_rc"] and result["output"] != False
+    result["time"] = time.perf_counter() - start
+    return result
+
+# runs all jobs of manifest on pool of workers, prints results and summary, returns True if all jobs passed
+def run_batch(jobs, workers, options, report_path = None):
+    start = time.perf_counter()
+    if workers == 1:
+        init_worker(options)
+        results = [run_job(job) for job in jobs]
     else:
-        return ""
+        with multiprocessing.Pool(workers, init_worker, (options,)) as pool:
+            results = pool.map(run_job, jobs, chunksize = max(1, len(jobs) // (workers * 8)))
+    wall = time.perf_counter() - start
+
+    passed = 0
+    for result in results:
+        passed += result["passed"]
+        state = "PASS" if result["passed"] else "FAIL"
+        print("%s %10.6f  rc %3d (expected %3d)  %s" % (state, result["time"], result["rc"], result["expected_rc"], result["source"]))
+    summary = {"jobs": len(results), "passed": passed, "failed": len(results) - passed, "workers": workers,
+               "wall_time": wall, "job_time": sum(result["time"] for result in results)}
+    print("BATCH | Jobs (" + str(summary["jobs"]) + ") | Passed (" + str(passed) + ") | Failed (" + str(summary["failed"]) +
+          ") | Wall time (" + "%.6f" % wall + " s) | Job time (" + "%.6f" % summary["job_time"] + " s)")
+    if report_path:
+        try:
+            with open(report_path, 'w') as f:
+                json.dump({"summary": summary, "results": results}, f, indent = 2)
+        except OSError:
+            sys.stderr.write('ERROR: Batch report cannot be written: ' + str(report_path) + "\n")
+            sys.exit(EXIT_CODES['OUTPUT_FILE_ERROR'])
+    return passed == len(results)
 
 # begin of the program
 def main(argv):
-    global labels
     xml_file = ""
-    long_opt = ["help", "source="]
+    source_format = "xml"
+    validate_jobs = 1
+    input_file = None
+    compile_only = False
+    optimize_code = False
+    profile_path = None
+    engine = "loop"
+    emit_python = None
+    specialize_code = False
+    max_call_depth = CallStack.MAX_DEPTH
+    max_steps = None
+    max_time = None
+    max_memory = None
+    checkpoint_file = None
+    checkpoint_every = None
+    resume = False
+    analysis_report = None
+    batch_file = None
+    batch_report = None
+    workers = os.cpu_count() or 1
+    cache_dir = None # cache is disabled
+    cache_size = CACHE_MAX_SIZE
+    buffer_size = Output.BUFFER_SIZE
+    flush_line = sys.stdout.isatty()
+    long_opt = ["help", "source=", "source-format=", "validate-jobs=", "compile-only", "cache", "cache-dir=", "cache-size=", "no-cache", "output-buffer=", "flush=", "input=", "optimize", "profile=", "engine=", "emit-python=", "specialize", "analysis-report=", "max-call-depth=",
+                "max-steps=", "max-time=", "max-memory=",
+                "checkpoint-file=", "checkpoint-every=", "resume", "batch=", "jobs=", "batch-report="]
     try:
         opts, args = getopt.getopt(argv, "hs:", long_opt)
     except getopt.GetoptError:
@@ -927,156 +3558,179 @@ def main(argv):
             if len(arg) == 0:
                 print('ERROR: No input file given')
                 sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
+        elif opt == "--source-format":
+            if arg not in ("xml", "code"):
+                sys.stderr.write('ERROR: Unknown source format: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            source_format = arg
+        elif opt == "--validate-jobs":
+            if not is_int(arg) or int(arg) < 1:
+                sys.stderr.write('ERROR: Invalid number of validation jobs: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            validate_jobs = int(arg)
+        elif opt == "--input":
+            input_file = arg
+        elif opt == "--profile":
+            profile_path = arg
+        elif opt == "--batch":
+            batch_file = arg
+        elif opt == "--batch-report":
+            batch_report = arg
+        elif opt == "--jobs":
+            if not is_int(arg) or int(arg) < 1:
+                sys.stderr.write('ERROR: Invalid number of jobs: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            workers = int(arg)
+        elif opt == "--engine":
+            if arg not in ENGINES:
+                sys.stderr.write('ERROR: Unknown engine: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            engine = arg
+        elif opt == "--emit-python":
+            emit_python = arg
+        elif opt == "--max-call-depth":
+            if not is_int(arg) or int(arg) < 0:
+                sys.stderr.write('ERROR: Invalid maximum call depth: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            max_call_depth = int(arg)
+        elif opt == "--max-steps":
+            if not is_int(arg) or int(arg) < 0:
+                sys.stderr.write('ERROR: Invalid maximum number of steps: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            max_steps = int(arg)
+        elif opt == "--max-time":
+            try:
+                max_time = float(arg)
+            except ValueError:
+                max_time = -1.0
+            if not max_time >= 0:
+                sys.stderr.write('ERROR: Invalid maximum time: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+        elif opt == "--max-memory":
+            if not is_int(arg) or int(arg) < 0:
+                sys.stderr.write('ERROR: Invalid maximum memory: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            max_memory = int(arg) * 1024 * 1024
+        elif opt == "--checkpoint-file":
+            checkpoint_file = arg
+        elif opt == "--checkpoint-every":
+            if not is_int(arg) or int(arg) < 1:
+                sys.stderr.write('ERROR: Invalid checkpoint interval: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            checkpoint_every = int(arg)
+        elif opt == "--resume":
+            resume = True
+        elif opt == "--specialize":
+            specialize_code = True
+        elif opt == "--analysis-report":
+            analysis_report = arg
+        elif opt == "--optimize":
+            optimize_code = True
+        elif opt == "--compile-only":
+            compile_only = True
+        elif opt == "--cache":
+            cache_dir = default_cache_dir()
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            if not is_int(arg) or int(arg) < 0:
+                sys.stderr.write('ERROR: Invalid cache size: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            cache_size = int(arg)
+        elif opt == "--no-cache":
+            cache_dir = None
+        elif opt == "--output-buffer":
+            if not is_int(arg) or int(arg) < 1:
+                sys.stderr.write('ERROR: Invalid output buffer size: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            buffer_size = int(arg)
+        elif opt == "--flush":
+            if arg not in ("line", "block"):
+                sys.stderr.write('ERROR: Invalid flush policy: ' + str(arg) + "\n")
+                sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+            flush_line = arg == "line"
 
     # addinational arguments not supported
     if args:
         sys.stderr.write('ERROR: Invalid parameters: ' + str(args) + "\n")
         sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
+    if (checkpoint_every != None or resume) and not checkpoint_file:
+        sys.stderr.write('ERROR: Checkpoint file is not given (--checkpoint-file)\n')
+        sys.exit(EXIT_CODES['INVALID_PARAMETER_ERROR'])
 
-    # verify xml file access
-    if os.path.exists(xml_file): # exists
-        if os.access(xml_file, os.R_OK): # is readable
-            try:
-                #dom = parse(xml_file)
-                tree = ET.parse(xml_file)
-            except ET.ParseError:
-                sys.stderr.write('ERROR: Invalid XML file: ' + str(xml_file) + "\n")
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-            except EX.ExpatError:
-                sys.stderr.write('ERROR: Invalid XML file: ' + str(xml_file) + "\n")
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-        else: # not readable
-            sys.stderr.write('ERROR: File is not readable: ' + str(xml_file) + "\n")
-            sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
-    else: # doesn't exist
-        sys.stderr.write('ERROR: File does not exist: ' + str(xml_file) + "\n")
-        sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
-
-    # ------ HEADER -------
-    # check valid xml header (mandatory in this project)
-    # <?xml version="1.0" encoding="UTF-8"?>
-    with open(xml_file) as f:
-        xml_header = f.readline()
-    match = re.match(r"<\?xml.*\?>",xml_header)
-    if not match:
-        sys.stderr.write('ERROR: Invalid XML file - no header found: ' + str(xml_file) + "\n")
-        sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-
-    # root of XML
-    root = tree.getroot()
-
-    #------ MAKING AST -------
-    xml_len = len(list(root))
-    AST = ['x'] * xml_len
-
-    labels = {}  # list of acessible labels in source code
-    label_names = []  # label names
-    l = ""  # current label
-    lb = False
-
-    arg_tags = ["arg1", "arg2", "arg3"]
-    program_attrib = ["language", "name", "description"]
-    inst_attrib = ["order", "opcode"]
-    arg_attrib = ["type"]
+    if batch_file != None:
+        try:
+            jobs = load_manifest(batch_file)
+        except LoadError as e:
+            sys.stderr.write(e.message)
+            sys.exit(EXIT_CODES[e.code])
+        options = {"cache_dir": cache_dir, "cache_size": cache_size, "optimize": optimize_code, "engine": engine,
+                   "specialize": specialize_code, "source_format": source_format, "max_steps": max_steps, "max_time": max_time, "max_memory": max_memory}
+        if not run_batch(jobs, workers, options, batch_report):
+            sys.exit(EXIT_CODES['BATCH_FAILED'])
+        sys.exit(EXIT_CODES['OK'])
 
-    # ------ XML VERIFICATION -------
-    # root = program tag (attributes name and description allowed as optonal)
-    # inst = instruction tag (attributes order and opcode requested as mandatory)
-    # arg = artument tag (attributes type requested as mandatory)
+    try:
+        program = get_program(xml_file, ProgramCache(cache_dir, cache_size) if cache_dir else None, engine == "python", source_format, validate_jobs)
+    except LoadError as e:
+        sys.stderr.write(e.message)
+        sys.exit(EXIT_CODES[e.code])
+    if emit_python != None:
+        try:
+            with open(emit_python, 'w') as f:
+                f.write(translate_program(program) or "# program with BREAK is not translated\n")
+        except OSError:
+            sys.stderr.write('ERROR: Python source cannot be written: ' + str(emit_python) + "\n")
+            sys.exit(EXIT_CODES['OUTPUT_FILE_ERROR'])
+    if compile_only:
+        sys.exit(EXIT_CODES['OK'])
 
-    check_attributes(root.tag,root.attrib,program_attrib)
-    for inst in root:
-        if inst.tag == "instruction":
-            check_attributes(inst.tag, inst.attrib, inst_attrib)
-            f_ord = inst.get('order') # tag has order attribute
-            if not f_ord: # instruction without order attribute
-                sys.stderr.write('ERROR: Invalid XML file ' + str(xml_file) + ' - order attribute missing\n')
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-            if not is_int(f_ord): # order attribute valid integer
-                sys.stderr.write('ERROR: Invalid XML file ' + str(xml_file) + ' - order attribute is not integer\n')
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-            if int(f_ord) < 1 or int(f_ord) > xml_len: # order in interval
-                # order out of range
-                sys.stderr.write('ERROR: Invalid instruction order: ' + str(f_ord) + "\n")
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-            f_name = inst.get('opcode')
-            if f_name:  # tag has opcode attribute
-                if f_name == "LABEL":
-                    lb = True
-                # check for valid instruction name
-                f_match = dict_find(Instruction.inst_args, f_name)
-                if f_match or f_match == "": # valid function
-                    arg_num = len(f_match) # gets number of arguments
-                    if len(list(inst)) == arg_num: # correct number of arguments
-                        tmp_arg_sheme = arg_tags[:arg_num] # allowed arg tags
-                        parameter_list = ['x'] * arg_num
-                        for arg in inst:
-                            if arg.tag in arg_tags: # arg1, arg2, arg3
-                                check_attributes(arg.tag, arg.attrib, arg_attrib)
-                                try:
-                                    tmp_arg_sheme.remove(arg.tag)
-                                except ValueError:
-                                    sys.stderr.write('ERROR: Instruction: ' + str(f_name) + ' at order: ' + str(f_ord) + ' has invalid argument tag.\n')
-                                    sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-                                if arg.get('type') == 'string':
-                                    arg.text = correct_string(arg.text)
-                                p = Parameter(arg.tag,arg.text,arg.get('type'))
-                                if p.check_type(): # checks only according to given type
-                                    parameter_list[int(arg.tag[-1]) - 1] = p # index already checked
-                                else:
-                                    sys.stderr.write('ERROR: Instruction: ' + str(f_name) + ' at order: ' + str(f_ord) + ' argument: ' + str(arg.tag) +' has incompatible type: ' + str(arg.get('type')) + ' with given value: ' + str(arg.text) + "\n")
-                                    sys.exit(EXIT_CODES['LEXYCAL_OR_SYNTACTIC_ERROR'])
-                            else:
-                                sys.stderr.write('ERROR: Instruction: ' + str(f_name) +' at order: ' + str(f_ord) + ' has invalid argument tag.\n')
-                                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-                        # final save to AST as object Instruction (order, function_name, parameter_list)
-                        i = Instruction(f_ord, f_name, parameter_list)
-                        AST[int(f_ord)-1] = i # index already checked
-                        if lb: # save label for jumps
-                            l = parameter_list[0].text
-                            if l not in label_names:
-                                label_names.append(l)
-                            else:
-                                sys.stderr.write("ERROR: Label '" + str(l) + "' redefinition at instruction order " + str(f_ord) + "\n")
-                                sys.exit(EXIT_CODES['SEMANTIC_ERROR'])
-                            labels[l] = f_ord
-                            lb = False
-                    else:
-                        # incorrect number of arguments
-                        sys.stderr.write('ERROR: Incorrect number of arguments in instruction: ' + str(f_name) + ' - at order: ' + str(f_ord) + " - given: " + str(len(list(inst))) + " (expected " + str(arg_num) + ")\n")
-                        sys.exit(EXIT_CODES['LEXYCAL_OR_SYNTACTIC_ERROR'])
-                else:
-                    # invalid function (not recognized)
-                    sys.stderr.write('ERROR: Not recognized instruction: ' + str(f_name) + " at order: " + str(f_ord) + "\n")
-                    sys.exit(EXIT_CODES['UNDEFINED_INSTRUCTION'])
-            else:
-                # instruction without opcode attribute
-                sys.stderr.write('ERROR: Invalid XML file: ' + str(xml_file) + ' - opcode attribute missing at order: ' + str(f_ord) + "\n")
-                sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-        else: # not instruction tag
-            sys.stderr.write('ERROR: Invalid XML file: ' + str(xml_file) + ' - instruction tag: ' + str(inst.tag) + "\n")
-            sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-
-    if 'x' in AST:
-        sys.stderr.write('ERROR: Invalid XML file: ' + str(xml_file) + ' - order attributes incorrect\n')
-        sys.exit(EXIT_CODES['BAD_XML_FORMAT'])
-
-    jumps = ["CALL", "JUMP", "JUMPIFEQ", "JUMPIFNEQ"]
-    for instruction in AST:
-        if instruction.name in jumps:
-            label_name = instruction.parameter_list[0].text
-            if label_name not in labels:
-                sys.stderr.write("ERROR: : Nonexistent label'" + str(label_name) + "in instruction at order '" + str(instruction.order) + "'\n")
-                sys.exit(EXIT_CODES['SEMANTIC_ERROR'])
-
-    # calling functions
-    # i one less than order
-    i = 0
-    while i < len(AST):
-        l = AST[i].call()
-        i += 1
-        if is_int(str(l)):
-            i = l
+    # run
+    code = link_program(program)
+    init_run()
+    if input_file != None:
+        try:
+            program_input.open_file(input_file)
+        except OSError:
+            sys.stderr.write('ERROR: Input file cannot be read: ' + str(input_file) + "\n")
+            sys.exit(EXIT_CODES['INPUT_FILE_ERROR'])
+    output.buffer_size = buffer_size
+    output.line = flush_line
+    cStack.max_depth = max_call_depth
+    budget.max_steps, budget.max_time, budget.max_memory = max_steps, max_time, max_memory
+    if resume:
+        try:
+            restore_checkpoint(checkpoint_file, program)
+        except LoadError as e:
+            sys.stderr.write(e.message)
+            sys.exit(EXIT_CODES[e.code])
+    if checkpoint_every != None:
+        budget.checkpoint = Checkpoint(checkpoint_file, checkpoint_every, program)
+    if optimize_code and engine != "python":
+        code = optimize(code)
+    if specialize_code or analysis_report:
+        analysis = analyze_program(program)
+        if analysis_report:
+            try:
+                with open(analysis_report, 'w') as f:
+                    json.dump(analysis.report(), f, indent = 2)
+            except OSError:
+                sys.stderr.write('ERROR: Analysis report cannot be written: ' + str(analysis_report) + "\n")
+                sys.exit(EXIT_CODES['OUTPUT_FILE_ERROR'])
+        if specialize_code and engine != "python":
+            code = specialize(code, analysis)
+    if profile_path:
+        profile = Profile(code, program.labels)
+        try:
+            execute_profiled(code, profile)
+        finally:
+            try:
+                profile.write(profile_path)
+            except OSError:
+                sys.stderr.write('ERROR: Profile cannot be written: ' + str(profile_path) + "\n")
+                sys.exit(EXIT_CODES['OUTPUT_FILE_ERROR'])
+    else:
+        ENGINES[engine](code, program)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -47,7 +47,22 @@ $instruction_list = array(
     "JUMPIFEQ" => "lss",
     "JUMPIFNEQ" => "lss",
     "DPRINT" => "s",
-    "BREAK" => ""
+    "BREAK" => "",
+    "CLEARS" => "",
+    "ADDS" => "",
+    "SUBS" => "",
+    "MULS" => "",
+    "IDIVS" => "",
+    "LTS" => "",
+    "GTS" => "",
+    "EQS" => "",
+    "ANDS" => "",
+    "ORS" => "",
+    "NOTS" => "",
+    "INT2CHARS" => "",
+    "STRI2INTS" => "",
+    "JUMPIFEQS" => "l",
+    "JUMPIFNEQS" => "l"
 );
 
 // -------------FUNCTIONS---------------
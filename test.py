@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Faculty of Information Technology, Brno University of Technology
+IPP (Principles of Programming Languages) - Project 2
+Name: IPP - IPPcode18 language testing utility
+Date created: April 2018
+Author: Jan Kubica
+Login: xkubic39
+Email: xkubic39@stud.fit.vutbr.cz
+File: test.py - IPPcode18 test report (parallel version of test.php)
+"""
+
+import sys
+import getopt
+import os
+import io
+import html
+import subprocess
+import tempfile
+import multiprocessing
+import importlib.util
+
+def print_help():
+    print("IPPcode18 LANGUAGE TESTER")
+    print("-------------------------")
+    print("DESCRIPTION")
+    print("This is simple testing utility taking test files and printing HTML report to ")
+    print("stdout. Each test consists of 4 files, source code file, input file, output file ")
+    print("and return code file ending with *.src, *.in, *.out and *.rc. The *.src files are ")
+    print("required, the other files are generated automatically if missing. Native input ")
+    print("and output is empty file, return code is 0. Source files which already contain ")
+    print("XML are not parsed. Tests run in parallel, interpret runs inside worker process.")
+    print("Optional *.args file runs interpret script once per line with options of the line")
+    print("({tmp} is temporary directory of the test), outputs of all runs are compared, return ")
+    print("code of the last run.")
+    print("")
+    print("PARAMETERS")
+    print("python3 test.py --help                  - prints out help")
+    print("                --directory=<path>      - test folder")
+    print("                --parse-script=<file>   - parse script file, natively './parse.php'")
+    print("                --int-script=<file>     - interpret script file, natively './interpret.py'")
+    print("                --php=<command>         - PHP interpreter of parse script, natively 'php5.6'")
+    print("                --recursive             - searches for other subdirectories in test folder")
+    print("                --jobs=<n>              - number of worker processes, natively CPU count")
+    print("                --modes                 - runs every test on all engines with and without")
+    print("                                          --optimize and --specialize")
+    print("")
+    print("Made by (c)Jan Kubica (xkubic39@stud.fit.vutbr.cz), April 2018")
+    sys.exit(0)
+
+# represents one folder with tests list
+class Folder:
+    def __init__(self, name):
+        self.name = name
+        self.tests = []
+
+# engines and options of --modes as (engine, optimize, specialize), python engine translates
+# program itself, so --optimize and --specialize do not change it
+MODES = [(engine, optimize, specialize) for engine in ("loop", "closure") for optimize in (False, True) for specialize in (False, True)]
+MODES.append(("python", False, False))
+DEFAULT_MODE = ("loop", False, False)
+
+# returns interpret script options of mode
+def mode_options(mode):
+    engine, optimize, specialize = mode
+    return ["--engine=" + engine] + (["--optimize"] if optimize else []) + (["--specialize"] if specialize else [])
+
+# represents one test with its attributes
+class Test:
+    def __init__(self, name, mode = DEFAULT_MODE):
+        self.name = name # path without extension
+        self.mode = mode # (engine, optimize, specialize)
+        self.ret_val = None # return value
+        self.ret_val_req = None
+        self.stderr = ""
+        self.stdout = ""
+        self.parser = "FAIL" # OK x FAIL x - (source is XML)
+        self.interpret = "FAIL" # OK x FAIL x - (parser failed)
+        self.diff = False # OK x FAIL x False (not compared)
+
+# fills folder with tests of directory (sorted as scandir), one test per mode, subdirectories
+# are appended to folders
+def create_tests(directory, folder, folders, recursive, modes):
+    for name in sorted(os.listdir(directory)):
+        path = os.path.realpath(os.path.join(directory, name))
+        if not os.path.isdir(path):
+            if len(path) > 4 and path.endswith("src"):
+                folder.tests.extend(Test(path[:-4], mode) for mode in modes)
+        elif recursive:
+            sub_folder = Folder(path)
+            folders.append(sub_folder)
+            create_tests(path, sub_folder, folders, recursive, modes)
+
+# ------ WORKER -------
+# options and interpret of this worker, set by init_worker
+worker = {}
+
+def init_worker(options):
+    spec = importlib.util.spec_from_file_location("interpret", options["int_script"])
+    interpret = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(interpret)
+    worker.update(options)
+    worker["module"] = interpret
+    worker["interpreters"] = {mode: interpret.Interpreter(*mode) for mode in options["modes"]}
+
+# runs interpret script once per line of .args file with options of the line and of test mode,
+# returns concatenated output, exit code of the last run and stderr
+def run_script(test, xml_file, data):
+    with open(test.name + ".args") as f:
+        runs = [line.split() for line in f if line.strip()]
+    output, ret_val, stderr = b"", 0, b""
+    with tempfile.TemporaryDirectory() as tmp:
+        for args in runs:
+            command = [sys.executable, worker["int_script"], "--source=" + xml_file] + [arg.replace("{tmp}", tmp) for arg in args] + mode_options(test.mode)
+            process = subprocess.run(command, input = data, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+            output += process.stdout
+            stderr += process.stderr
+            ret_val = process.returncode
+    return ret_val, output, stderr.decode(errors = "replace")
+
+# runs one test - parser (unless source is XML) and interpret in this process, returns Test
+def run_test(test):
+    interpret = worker["module"]
+    # create missing files
+    if not os.path.exists(test.name + ".rc"):
+        with open(test.name + ".rc", 'w') as f:
+            f.write("0")
+    for ext in (".in", ".out"):
+        if not os.path.exists(test.name + ext):
+            open(test.name + ext, 'wb').close()
+
+    with open(test.name + ".src", 'rb') as f:
+        source = f.read()
+    with open(test.name + ".rc") as f:
+        test.ret_val_req = f.read().strip()
+
+    xml_file = None
+    try:
+        if source.lstrip().startswith(b"<?xml"):
+            test.parser = "-"
+            xml_file = test.name + ".src"
+        else:
+            # execute parser
+            process = subprocess.run([worker["php"], worker["parse_script"]], input = source, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+            test.ret_val = process.returncode
+            test.stdout = process.stdout.decode(errors = "replace")
+            test.stderr = process.stderr.decode(errors = "replace")
+            if len(process.stderr) != 0:
+                test.interpret = "-"
+                return test
+            test.parser = "OK"
+            with tempfile.NamedTemporaryFile(suffix = ".xml", delete = False) as f:
+                f.write(process.stdout)
+                xml_file = f.name
+
+        # if success, execute interpret
+        with open(test.name + ".in", 'rb') as f:
+            data = f.read()
+        if os.path.exists(test.name + ".args"):
+            test.ret_val, output, test.stderr = run_script(test, xml_file, data)
+        else:
+            interpreter = worker["interpreters"][test.mode]
+            try:
+                result = interpreter.run(interpreter.load(xml_file), stdin = io.BytesIO(data))
+                test.ret_val, output, test.stderr = result.exit_code, result.output, result.errors
+            except interpret.LoadError as e:
+                test.ret_val, output, test.stderr = interpret.EXIT_CODES[e.code], b"", e.message
+        test.stdout = output.decode(errors = "replace")
+        if len(test.stderr) == 0 or test.ret_val == 0:
+            test.interpret = "OK"
+        with open(test.name + ".out", 'rb') as f:
+            test.diff = "OK" if f.read() == output else "FAIL"
+    except OSError as e:
+        test.stderr = "ERROR: " + str(e)
+    finally:
+        if xml_file != None and test.parser == "OK":
+            os.remove(xml_file)
+    return test
+
+# ------- MAIN ---------
+def main(argv):
+    options = {"parse_script": "./parse.php", "int_script": "./interpret.py", "php": "php5.6", "modes": [DEFAULT_MODE]}
+    root_path = os.getcwd()
+    recursive = False
+    workers = os.cpu_count() or 1
+    long_opt = ["help", "directory=", "recursive", "parse-script=", "int-script=", "php=", "jobs=", "modes"]
+    try:
+        opts, args = getopt.getopt(argv, "hd:rp:i:", long_opt)
+    except getopt.GetoptError:
+        print_help()
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+        elif opt in ("-d", "--directory"):
+            root_path = arg
+        elif opt in ("-r", "--recursive"):
+            recursive = True
+        elif opt in ("-p", "--parse-script"):
+            options["parse_script"] = arg
+        elif opt in ("-i", "--int-script"):
+            options["int_script"] = arg
+        elif opt == "--php":
+            options["php"] = arg
+        elif opt == "--jobs":
+            if not arg.isdigit() or int(arg) < 1:
+                sys.stderr.write("ERROR: Invalid number of jobs: " + str(arg) + "\n")
+                sys.exit(10)
+            workers = int(arg)
+        elif opt == "--modes":
+            options["modes"] = MODES
+
+    if not os.path.exists(root_path):
+        sys.stderr.write("ERROR: Given path not found\n")
+        sys.exit(11)
+    if not os.path.exists(options["int_script"]):
+        sys.stderr.write("ERROR: Interpret script not found: " + str(options["int_script"]) + "\n")
+        sys.exit(11)
+
+    # look for tests in directory
+    root_folder = Folder(root_path)
+    folders = [root_folder]
+    create_tests(root_path, root_folder, folders, recursive, options["modes"])
+
+    # run tests
+    tests = [test for folder in folders for test in folder.tests]
+    if workers == 1:
+        init_worker(options)
+        results = [run_test(test) for test in tests]
+    else:
+        with multiprocessing.Pool(workers, init_worker, (options,)) as pool:
+            results = pool.map(run_test, tests, chunksize = max(1, len(tests) // (workers * 8)))
+    results = iter(results)
+    for folder in folders:
+        folder.tests = [next(results) for _ in folder.tests]
+
+    print_report(folders, root_path, options, recursive)
+
+# prints HTML report to stdout (same as test.php)
+def print_report(folders, root_path, options, recursive):
+    out = []
+    out.append("<!DOCTYPE html>")
+    out.append("<html>")
+    out.append("   <head>")
+    out.append('      <meta charset="UTF-8">')
+    out.append("      <title>Test Report</title>")
+    out.append("   </head>")
+    out.append("   <body>")
+    out.append("      <h1>IPPcode18 - Test report</h1>")
+    out.append("      <p>")
+    out.append("      Test script: <b>" + html.escape(os.path.abspath(__file__)) + "</b><br>")
+    out.append("      Root folder: <b>" + html.escape(root_path) + "</b><br>")
+    out.append("      Parser: <b>" + html.escape(options["parse_script"]) + "</b><br>")
+    out.append("      Interpret: <b>" + html.escape(options["int_script"]) + "</b><br>")
+    out.append("      Recursive search: <b>" + ("true" if recursive else "false") + "</b><br>")
+    out.append("      </p>")
+    out.append("      <h3>Test results:</h3>")
+
+    succ_all = 0
+    test_all = 0
+    for folder in folders:
+        out.append('      <table style="width:100%" border="1"><thead>')
+        out.append('         <tr><td colspan="8" style="padding:5px">Folder: <b>' + html.escape(folder.name) + '</b></td></tr>')
+        out.append("         <tr>")
+        for title in ("Test name", "Parser processed", "Interpret processed", "Return code", "Return code requested",
+                      "Stdout diffcheck", "Stdout", "Stderr"):
+            out.append("            <th>" + title + "</th>")
+        out.append("         </tr></thead>")
+        out.append("      <tbody>")
+
+        success = 0
+        for test in folder.tests:
+            name = os.path.basename(test.name)
+            if len(options["modes"]) > 1:
+                name += " [" + " ".join(mode_options(test.mode)) + "]"
+            name = html.escape(name)
+            out.append("         <tr>")
+            if test.diff == "OK" and str(test.ret_val) == test.ret_val_req:
+                out.append('            <td align="center" bgcolor="#00FF00" style="padding:5px">' + name + "</td>")
+                success += 1
+            else:
+                out.append('            <td align="center" bgcolor="#FF0000" style="padding:5px">' + name + "</td>")
+            out.append('            <td align="center">' + test.parser + "</td>")
+            out.append('            <td align="center">' + test.interpret + "</td>")
+            out.append('            <td align="center">' + str(test.ret_val) + "</td>")
+            out.append('            <td align="center">' + html.escape(test.ret_val_req) + "</td>")
+            out.append('            <td align="center">' + (test.diff or "") + "</td>")
+            out.append('            <td style="padding:5px"><pre>' + html.escape(test.stdout) + "</pre></td>")
+            out.append('            <td style="padding:5px"><pre>' + html.escape(test.stderr) + "</pre></td>")
+            out.append("         </tr>")
+        out.append('         <tr><td align="right" colspan="8" style="padding:5px">Succeded <b>' + str(success) + "</b> of " + str(len(folder.tests)) + " tests.</td></tr>")
+        out.append("      </tbody></table><br>")
+        succ_all += success
+        test_all += len(folder.tests)
+
+    out.append('      <h3 align="right">In total: ' + str(succ_all) + " of " + str(test_all) + " tests succeded</h3>")
+    out.append("   </body>")
+    out.append("</html>")
+    sys.stdout.write("\n".join(out) + "\n")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])